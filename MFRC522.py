@@ -2,16 +2,44 @@
 # Trace commented out and the Read and Write methods modified to return values.
 # Also changed to use the Broadcom pin mode
 
-import RPi.GPIO as GPIO
-import spi
+from backend import SpiBackend
 import signal
 import time
 
+def _CRC_A_Table():
+  # Byte-wise lookup for the reflected CRC-16/CCITT polynomial used by ISO14443A
+  table = []
+  for i in range(256):
+    crc = i
+    for bit in range(8):
+      if crc & 0x01:
+        crc = (crc >> 1) ^ 0x8408
+      else:
+        crc = crc >> 1
+    table.append(crc)
+  return table
+
+CRC_A_TABLE = _CRC_A_Table()
+
+def CRC_A(data):
+  # Returns the CRC_A of data as [low byte, high byte], the order it is sent in
+  crc = 0x6363
+  for byte in data:
+    crc = (crc >> 8) ^ CRC_A_TABLE[(crc ^ byte) & 0xFF]
+  return [crc & 0xFF, crc >> 8]
+
 class MFRC522:
   NRSTPD = 25
   
   MAX_LEN = 16
   
+  # Seconds to yield between polls of an interrupt register
+  POLL_INTERVAL  = 0.0005
+  # Slack on top of the chip timer before a command is given up on
+  TIMEOUT_MARGIN = 0.01
+  # The CRC coprocessor is done within microseconds
+  CRC_TIMEOUT    = 0.005
+  
   PCD_IDLE       = 0x00
   PCD_AUTHENT    = 0x0E
   PCD_RECEIVE    = 0x08
@@ -108,23 +136,59 @@ class MFRC522:
     
   serNum = []
   
-  def __init__(self, dev='/dev/spidev0.0', spd=1000000):
-    spi.openSPI(device=dev,speed=spd)
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(25, GPIO.OUT)
-    GPIO.output(self.NRSTPD, 1)
+  # Where CRC_A is calculated: the chip's coprocessor, the host, or both
+  # with the results compared
+  CRC_CHIP  = 'chip'
+  CRC_HOST  = 'host'
+  CRC_CHECK = 'check'
+  
+  def __init__(self, dev='/dev/spidev0.0', spd=1000000, backend=None, irq_pin=None, crc=CRC_CHIP):
+    # Number of SPI transactions issued, each one costs an ioctl
+    self.transfers = 0
+    self.crc = crc
+    self.crcMismatches = 0
+    if backend is None:
+      backend = SpiBackend(dev, spd)
+    self.backend = backend
+    self.backend.setup_output(self.NRSTPD)
+    self.backend.output(self.NRSTPD, 1)
+    # Broadcom number of the pin the IRQ output is wired to, if any
+    self.irq_pin = irq_pin
+    if self.irq_pin is not None:
+      self.backend.setup_irq(self.irq_pin)
     self.MFRC522_Init()
   
   def MFRC522_Reset(self):
     self.Write_MFRC522(self.CommandReg, self.PCD_RESETPHASE)
   
+  def Transfer_MFRC522(self, data):
+    self.transfers += 1
+    return self.backend.transfer(data)
+  
   def Write_MFRC522(self, addr, val):
-    spi.transfer(((addr<<1)&0x7E,val))
+    self.Transfer_MFRC522(((addr<<1)&0x7E,val))
   
   def Read_MFRC522(self, addr):
-    val = spi.transfer((((addr<<1)&0x7E) | 0x80,0))
+    val = self.Transfer_MFRC522((((addr<<1)&0x7E) | 0x80,0))
     return val[1]
   
+  def Write_MFRC522_Burst(self, addr, vals):
+    # Every byte following the address goes to the same register,
+    # so the whole FIFO can be filled in a single transaction
+    data = [(addr<<1)&0x7E]
+    data.extend(vals)
+    self.Transfer_MFRC522(data)
+  
+  def Read_MFRC522_Multi(self, addrs):
+    # Each address byte is answered in the following byte, the
+    # trailing 0 only clocks out the value of the last register
+    data = [((addr<<1)&0x7E) | 0x80 for addr in addrs]
+    data.append(0)
+    return list(self.Transfer_MFRC522(data)[1:])
+  
+  def Read_MFRC522_Burst(self, addr, count):
+    return self.Read_MFRC522_Multi([addr] * count)
+  
   def SetBitMask(self, reg, mask):
     tmp = self.Read_MFRC522(reg)
     self.Write_MFRC522(reg, tmp | mask)
@@ -141,57 +205,85 @@ class MFRC522:
   def AntennaOff(self):
     self.ClearBitMask(self.TxControlReg, 0x03)
   
+  def MFRC522_WaitIrq(self, reg, mask, timeout, useIrq=True):
+    # Wait until any bit of mask is set in reg or timeout seconds have
+    # passed. Between polls the thread sleeps on the IRQ line when one is
+    # wired up, otherwise it yields for POLL_INTERVAL so the UI and network
+    # threads get to run. Returns the last value read, or None on timeout.
+    deadline = time.monotonic() + timeout
+    while True:
+      n = self.Read_MFRC522(reg)
+      if n & mask:
+        return n
+      
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return None
+      
+      if useIrq and self.irq_pin is not None:
+        if self.backend.wait_irq(remaining):
+          self.backend.clear_irq()
+      else:
+        time.sleep(min(self.POLL_INTERVAL, remaining))
+  
   def MFRC522_ToCard(self,command,sendData):
     backData = []
     backLen = 0
     status = self.MI_ERR
-    irqEn = 0x00
     waitIRq = 0x00
     lastBits = None
     n = 0
-    i = 0
     
     if command == self.PCD_AUTHENT:
-      irqEn = 0x12
       waitIRq = 0x10
     if command == self.PCD_TRANSCEIVE:
-      irqEn = 0x77
       waitIRq = 0x30
+    if command == self.PCD_TRANSMIT:
+      waitIRq = 0x40
     
-    self.Write_MFRC522(self.CommIEnReg, irqEn|0x80)
-    self.ClearBitMask(self.CommIrqReg, 0x80)
-    self.SetBitMask(self.FIFOLevelReg, 0x80)
+    # Only the interrupts ending the command are enabled so the first edge
+    # on the IRQ line means the command is done. TimerIRq means no answer.
+    self.Write_MFRC522(self.CommIEnReg, waitIRq|0x01|0x80)
+    # Set1 is 0 so every request bit written as 1 gets cleared
+    self.Write_MFRC522(self.CommIrqReg, 0x7F)
+    # FlushBuffer is the only writable bit in FIFOLevelReg
+    self.Write_MFRC522(self.FIFOLevelReg, 0x80)
     
     self.Write_MFRC522(self.CommandReg, self.PCD_IDLE);  
     
-    while(i<len(sendData)):
-      self.Write_MFRC522(self.FIFODataReg, sendData[i])
-      i = i+1
+    self.Write_MFRC522_Burst(self.FIFODataReg, sendData)
+    
+    if self.irq_pin is not None:
+      self.backend.clear_irq()
     
     self.Write_MFRC522(self.CommandReg, command)
       
     if command == self.PCD_TRANSCEIVE:
-      self.SetBitMask(self.BitFramingReg, 0x80)
+      bitFraming = self.Read_MFRC522(self.BitFramingReg)
+      self.Write_MFRC522(self.BitFramingReg, bitFraming | 0x80)
     
-    i = 2000
-    while True:
-      n = self.Read_MFRC522(self.CommIrqReg)
-      i = i - 1
-      if ~((i!=0) and ~(n&0x01) and ~(n&waitIRq)):
-        break
+    n = self.MFRC522_WaitIrq(self.CommIrqReg, waitIRq|0x01, self.timeout + self.TIMEOUT_MARGIN)
     
-    self.ClearBitMask(self.BitFramingReg, 0x80)
+    if command == self.PCD_TRANSCEIVE:
+      self.Write_MFRC522(self.BitFramingReg, bitFraming & 0x7F)
   
-    if i != 0:
-      if (self.Read_MFRC522(self.ErrorReg) & 0x1B)==0x00:
+    if n is None:
+      # The chip never finished, its own timer should have fired before this
+      status = self.MI_ERR
+    elif not (n & waitIRq):
+      status = self.MI_NOTAGERR
+    else:
+      if command == self.PCD_TRANSCEIVE:
+        (error, level, control) = self.Read_MFRC522_Multi([self.ErrorReg, self.FIFOLevelReg, self.ControlReg])
+      else:
+        error = self.Read_MFRC522(self.ErrorReg)
+      
+      if (error & 0x1B)==0x00:
         status = self.MI_OK
-
-        if n & irqEn & 0x01:
-          status = self.MI_NOTAGERR
       
         if command == self.PCD_TRANSCEIVE:
-          n = self.Read_MFRC522(self.FIFOLevelReg)
-          lastBits = self.Read_MFRC522(self.ControlReg) & 0x07
+          n = level
+          lastBits = control & 0x07
           if lastBits != 0:
             backLen = (n-1)*8 + lastBits
           else:
@@ -202,10 +294,7 @@ class MFRC522:
           if n > self.MAX_LEN:
             n = self.MAX_LEN
     
-          i = 0
-          while i<n:
-            backData.append(self.Read_MFRC522(self.FIFODataReg))
-            i = i + 1;
+          backData = self.Read_MFRC522_Burst(self.FIFODataReg, n)
       else:
         status = self.MI_ERR
 
@@ -228,6 +317,11 @@ class MFRC522:
     return (status,backBits)
   
   
+  def MFRC522_Probe(self, reqMode):
+    # Check for a card in the field. Returns True if a card answered.
+    (status,backBits) = self.MFRC522_Request(reqMode)
+    return status == self.MI_OK
+  
   def MFRC522_Anticoll(self):
     backData = []
     serNumCheck = 0
@@ -255,22 +349,28 @@ class MFRC522:
     return (status,backData)
   
   def CalulateCRC(self, pIndata):
-    self.ClearBitMask(self.DivIrqReg, 0x04)
-    self.SetBitMask(self.FIFOLevelReg, 0x80);
-    i = 0
-    while i<len(pIndata):
-      self.Write_MFRC522(self.FIFODataReg, pIndata[i])
-      i = i + 1
+    if self.crc == self.CRC_HOST:
+      return CRC_A(pIndata)
+    
+    pOutData = self.CalulateCRC_Chip(pIndata)
+    
+    if self.crc == self.CRC_CHECK:
+      expected = CRC_A(pIndata)
+      if pOutData != expected:
+        self.crcMismatches += 1
+        print("CRC MISMATCH!! chip " + str(pOutData) + " host " + str(expected))
+        return expected
+    
+    return pOutData
+  
+  def CalulateCRC_Chip(self, pIndata):
+    # Set2 is 0 so writing the CRCIRq bit clears it
+    self.Write_MFRC522(self.DivIrqReg, 0x04)
+    self.Write_MFRC522(self.FIFOLevelReg, 0x80)
+    self.Write_MFRC522_Burst(self.FIFODataReg, pIndata)
     self.Write_MFRC522(self.CommandReg, self.PCD_CALCCRC)
-    i = 0xFF
-    while True:
-      n = self.Read_MFRC522(self.DivIrqReg)
-      i = i - 1
-      if not ((i != 0) and not (n&0x04)):
-        break
-    pOutData = []
-    pOutData.append(self.Read_MFRC522(self.CRCResultRegL))
-    pOutData.append(self.Read_MFRC522(self.CRCResultRegM))
+    self.MFRC522_WaitIrq(self.DivIrqReg, 0x04, self.CRC_TIMEOUT, useIrq=False)
+    pOutData = self.Read_MFRC522_Multi([self.CRCResultRegL, self.CRCResultRegM])
     return pOutData
   
   def MFRC522_SelectTag(self, serNum):
@@ -303,16 +403,10 @@ class MFRC522:
     buff.append(BlockAddr)
 
     # Now we need to append the authKey which usually is 6 bytes of 0xFF
-    i = 0
-    while(i < len(Sectorkey)):
-      buff.append(Sectorkey[i])
-      i = i + 1
-    i = 0
+    buff.extend(Sectorkey)
 
     # Next we append the first 4 bytes of the UID
-    while(i < 4):
-      buff.append(serNum[i])
-      i = i +1
+    buff.extend(serNum[:4])
 
     # Now we start the authentication itself
     (status, backData, backLen) = self.MFRC522_ToCard(self.PCD_AUTHENT,buff)
@@ -326,6 +420,15 @@ class MFRC522:
     # Return the status
     return status
   
+  def MFRC522_Halt(self):
+    # HLTA puts the selected card to sleep so REQIDL no longer wakes it up,
+    # only WUPA does. The card never answers so the frame is only transmitted
+    # rather than waiting for the receive timeout.
+    buf = [self.PICC_HALT, 0]
+    buf += self.CalulateCRC(buf)
+    (status, backData, backLen) = self.MFRC522_ToCard(self.PCD_TRANSMIT, buf)
+    return status
+  
   def MFRC522_StopCrypto1(self):
     self.ClearBitMask(self.Status2Reg, 0x08)
 
@@ -369,8 +472,58 @@ class MFRC522:
         (status, backData, backLen) = self.MFRC522_ToCard(self.PCD_TRANSCEIVE,buf)
         if not(status == self.MI_OK) or not(backLen == 4) or not((backData[0] & 0x0F) == 0x0A):
             print("Error while writing")
+            status = self.MI_ERR
         # if status == self.MI_OK:
         #     print "Data written"
+    return status
+
+  def MFRC522_SectorTrailer(self, blockAddr):
+    # Sectors 0-31 have 4 blocks, sectors 32-39 of a 4K card have 16
+    if blockAddr < 128:
+      return (blockAddr // 4) * 4 + 3
+    return (blockAddr // 16) * 16 + 15
+
+  def MFRC522_ReadBlocks(self, authMode, blockAddrs, Sectorkey, serNum):
+    # Read several blocks, authenticating only once per sector. Returns the
+    # data of all blocks concatenated, or None if any block failed.
+    data = []
+    trailer = None
+    # The same frame buffer is reused for every block
+    buf = [self.PICC_READ, 0, 0, 0]
+    for blockAddr in blockAddrs:
+      if self.MFRC522_SectorTrailer(blockAddr) != trailer:
+        trailer = self.MFRC522_SectorTrailer(blockAddr)
+        if self.MFRC522_Auth(authMode, trailer, Sectorkey, serNum) != self.MI_OK:
+          return None
+      buf[1] = blockAddr
+      buf[2:4] = self.CalulateCRC(buf[0:2])
+      (status, backData, backLen) = self.MFRC522_ToCard(self.PCD_TRANSCEIVE, buf)
+      if status != self.MI_OK or len(backData) != 16:
+        print("Error while reading!")
+        return None
+      data.extend(backData)
+    return data
+
+  def MFRC522_ReadSector(self, authMode, sector, Sectorkey, serNum):
+    # Read the data blocks of a sector, leaving out its trailer
+    if sector < 32:
+      blockAddrs = range(sector * 4, sector * 4 + 3)
+    else:
+      blockAddrs = range(128 + (sector - 32) * 16, 128 + (sector - 32) * 16 + 15)
+    return self.MFRC522_ReadBlocks(authMode, blockAddrs, Sectorkey, serNum)
+
+  def MFRC522_WriteBlocks(self, authMode, blockAddrs, writeData, Sectorkey, serNum):
+    # Write 16 bytes of writeData to each block, authenticating only once
+    # per sector. Returns MI_OK if every block was written.
+    trailer = None
+    for i, blockAddr in enumerate(blockAddrs):
+      if self.MFRC522_SectorTrailer(blockAddr) != trailer:
+        trailer = self.MFRC522_SectorTrailer(blockAddr)
+        if self.MFRC522_Auth(authMode, trailer, Sectorkey, serNum) != self.MI_OK:
+          return self.MI_ERR
+      if self.MFRC522_Write(blockAddr, writeData[i*16:(i+1)*16]) != self.MI_OK:
+        return self.MI_ERR
+    return self.MI_OK
 
   def MFRC522_DumpClassic1K(self, key, uid):
     i = 0
@@ -383,17 +536,29 @@ class MFRC522:
             print("Authentication error")
         i = i+1
 
+  def MFRC522_SetTimer(self, prescaler, reload):
+    # The timer starts automatically at the end of every transmission (TAuto)
+    # and raises TimerIRq when no answer came within reload + 1 ticks
+    self.Write_MFRC522(self.TModeReg, 0x80 | (prescaler >> 8))
+    self.Write_MFRC522(self.TPrescalerReg, prescaler & 0xFF)
+    self.Write_MFRC522(self.TReloadRegL, reload & 0xFF)
+    self.Write_MFRC522(self.TReloadRegH, reload >> 8)
+    # Each tick lasts (2 * prescaler + 1) cycles of the 13.56 MHz clock
+    self.timeout = (reload + 1) * (2 * prescaler + 1) / 13.56e6
+  
   def MFRC522_Init(self):
-    GPIO.output(self.NRSTPD, 1)
+    self.backend.output(self.NRSTPD, 1)
   
     self.MFRC522_Reset();
     
     
-    self.Write_MFRC522(self.TModeReg, 0x8D)
-    self.Write_MFRC522(self.TPrescalerReg, 0x3E)
-    self.Write_MFRC522(self.TReloadRegL, 30)
-    self.Write_MFRC522(self.TReloadRegH, 0)
+    self.MFRC522_SetTimer(0xD3E, 30)
     
     self.Write_MFRC522(self.TxAutoReg, 0x40)
     self.Write_MFRC522(self.ModeReg, 0x3D)
+    
+    if self.irq_pin is not None:
+      # Drive the IRQ line push-pull rather than open drain
+      self.Write_MFRC522(self.DivlEnReg, 0x80)
+    
     self.AntennaOn()
@@ -1,5 +1,5 @@
 import MFRC522
-import RPi.GPIO as GPIO
+import threading
 import time
   
 class SimpleMFRC522:
@@ -9,18 +9,38 @@ class SimpleMFRC522:
   KEY = [0xFF,0xFF,0xFF,0xFF,0xFF,0xFF]
   BLOCK_ADDRS = [8, 9, 10]
   
-  def __init__(self):
-    self.READER = MFRC522.MFRC522()
+  # Idle probing backs off from the minimum to the maximum interval
+  MIN_PROBE_INTERVAL = 0.02
+  MAX_PROBE_INTERVAL = 0.2
+  
+  # Seconds before the card that was just read is read again
+  DEBOUNCE = 2
+  
+  def __init__(self, backend=None, irq_pin=None, crc=MFRC522.MFRC522.CRC_CHIP, debounce=DEBOUNCE, uid_cache=None):
+    self.READER = MFRC522.MFRC522(backend=backend, irq_pin=irq_pin, crc=crc)
+    self.debounce = debounce
+    # Maps a card's id to the text read from it, a card found in it isn't read again
+    self.uid_cache = uid_cache
+    # Set while a card is in the field, including a halted one
+    self.card_present = threading.Event()
+    self._interval = self.MIN_PROBE_INTERVAL
+    self._answered = False
+    # The last card read is halted until it leaves the field
+    self._halted = False
+    self._last_id = None
+    self._last_time = 0
   
   def read(self):
       id, text = self.read_no_block()        
       while not id:
+          self.wait_for_card()
           id, text = self.read_no_block()  
       return id, text
 
   def read_id(self):
     id, text = self.read_no_block()        
     while not id:
+      self.wait_for_card()
       id, text = self.read_no_block()  
     return id
 
@@ -28,57 +48,111 @@ class SimpleMFRC522:
     id, text = self.read_no_block()
     return id
   
+  def wait_for_card(self, timeout=None):
+    """
+    Block until a card is in the field or timeout seconds have passed.
+    The reader is probed with growing pauses while no card shows up, so
+    an empty reader costs next to nothing. Returns True if a card is present.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      if self.READER.MFRC522_Probe(self.READER.PICC_REQIDL):
+        # The card has answered REQA, read_no_block carries on from here
+        self._answered = True
+        self._interval = self.MIN_PROBE_INTERVAL
+        self.card_present.set()
+        return True
+      
+      # A halted card only answers WUPA. Once it stops answering it has been
+      # taken away, and the next REQA sends it back to sleep if it hasn't.
+      if self._halted and not self.READER.MFRC522_Probe(self.READER.PICC_REQALL):
+        self._halted = False
+      
+      if not self._halted:
+        self.card_present.clear()
+      
+      delay = self._interval
+      self._interval = min(self._interval * 2, self.MAX_PROBE_INTERVAL)
+      
+      if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          return False
+        delay = min(delay, remaining)
+      
+      time.sleep(delay)
+  
   def read_no_block(self):
-    (status, TagType) = self.READER.MFRC522_Request(self.READER.PICC_REQIDL)
-    if status != self.READER.MI_OK:
-        return None, None
+    if self._answered:
+      self._answered = False
+    else:
+      (status, TagType) = self.READER.MFRC522_Request(self.READER.PICC_REQIDL)
+      if status != self.READER.MI_OK:
+          return None, None
     (status, uid) = self.READER.MFRC522_Anticoll()
     if status != self.READER.MI_OK:
         return None, None
     id = self.uid_to_num(uid)
     self.READER.MFRC522_SelectTag(uid)
-    status = self.READER.MFRC522_Auth(self.READER.PICC_AUTHENT1A, 11, self.KEY, uid)
-    data = []
-    text_read = ''
-    if status == self.READER.MI_OK:
-        for block_num in self.BLOCK_ADDRS:
-            block = self.READER.MFRC522_Read(block_num) 
-            if block:
-                    data += block
-        if data:
-             text_read = ''.join(chr(i) for i in data)
-    self.READER.MFRC522_StopCrypto1()
-    time.sleep(0.1)
+    # The same card tapped again straight away is put back to sleep unread,
+    # any other card is read immediately
+    if id == self._last_id and time.monotonic() - self._last_time < self.debounce:
+        self._halt()
+        return None, None
+    text_read = None
+    if self.uid_cache is not None:
+        text_read = self.uid_cache.get(id)
+    if text_read is None:
+        data = self.READER.MFRC522_ReadBlocks(self.READER.PICC_AUTHENT1A, self.BLOCK_ADDRS, self.KEY, uid)
+        if not data:
+            # A card that couldn't be read isn't halted or debounced, it
+            # drops back to idle and the next probe reads it again
+            self.READER.MFRC522_StopCrypto1()
+            return None, None
+        text_read = ''.join(chr(i) for i in data)
+        if self.uid_cache is not None:
+            self.uid_cache.put(id, text_read)
+    self._halt()
+    self._last_id = id
+    self._last_time = time.monotonic()
     return id, text_read
+  
+  def _halt(self):
+    self.READER.MFRC522_Halt()
+    self.READER.MFRC522_StopCrypto1()
+    self._halted = True
     
     
   def write(self, text):
       id, text_in = self.write_no_block(text)        
       while not id:
+          self.wait_for_card()
           id, text_in = self.write_no_block(text)  
       return id, text_in
 
 
   def write_no_block(self, text):
-      (status, TagType) = self.READER.MFRC522_Request(self.READER.PICC_REQIDL)
-      if status != self.READER.MI_OK:
-          return None, None
+      if self._answered:
+          self._answered = False
+      else:
+          (status, TagType) = self.READER.MFRC522_Request(self.READER.PICC_REQIDL)
+          if status != self.READER.MI_OK:
+              return None, None
       (status, uid) = self.READER.MFRC522_Anticoll()
       if status != self.READER.MI_OK:
           return None, None
       id = self.uid_to_num(uid)
       self.READER.MFRC522_SelectTag(uid)
-      status = self.READER.MFRC522_Auth(self.READER.PICC_AUTHENT1A, 11, self.KEY, uid)
-      self.READER.MFRC522_Read(11)
-      if status == self.READER.MI_OK:
-          data = bytearray()
-          data.extend(bytearray(text.ljust(len(self.BLOCK_ADDRS) * 16).encode('ascii')))
-          i = 0
-          for block_num in self.BLOCK_ADDRS:
-            self.READER.MFRC522_Write(block_num, data[(i*16):(i+1)*16])
-            i += 1
-      self.READER.MFRC522_StopCrypto1()
-      time.sleep(0.1)
+      data = bytearray(text.ljust(len(self.BLOCK_ADDRS) * 16).encode('ascii'))
+      status = self.READER.MFRC522_WriteBlocks(self.READER.PICC_AUTHENT1A, self.BLOCK_ADDRS, data, self.KEY, uid)
+      if self.uid_cache is not None:
+          # Remember the new text as it will be read back, and forget a
+          # card that may only have been partly written
+          if status == self.READER.MI_OK:
+              self.uid_cache.put(id, ''.join(chr(i) for i in data))
+          else:
+              self.uid_cache.remove(id)
+      self._halt()
       return id, text[0:(len(self.BLOCK_ADDRS) * 16)]
       
   def uid_to_num(self, uid):
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+import wave
+from collections import namedtuple
+from runtime import Runtime
+
+
+SOUNDS_PATH = '/home/pi/qwickly/sounds'
+CACHE_PATH = '/home/pi/qwickly/sound_cache'
+
+# Decoded sound, frames are raw little endian PCM samples
+Clip = namedtuple('Clip', 'frames rate channels width')
+
+# Sound priorities, lower numbers are more urgent. Feedback for a swipe
+# cuts off announcements and feedback for earlier swipes.
+FEEDBACK = 0
+ANNOUNCEMENT = 1
+
+
+class _Request:
+    """ A sound waiting to be played """
+
+    __slots__ = ('path', 'priority', 'order', 'deadline')
+
+    def __init__(self, path, priority, order, deadline):
+        self.path = path
+        self.priority = priority
+        self.order = order
+        self.deadline = deadline
+
+
+def decode(path, cache_dir=CACHE_PATH):
+    """
+    Decode an mp3 file with mpg321. The result is kept in cache_dir as a
+    WAV file named after the mp3's contents, so every sound is decoded
+    only once.
+
+    Returns:
+        Clip: the decoded sound
+
+    Raises:
+        OSError: if the file can't be read or mpg321 can't be run
+        subprocess.CalledProcessError: if mpg321 fails
+    """
+
+    with open(path, 'rb') as mp3_file:
+        digest = hashlib.sha1(mp3_file.read()).hexdigest()
+
+    wav_path = os.path.join(cache_dir, digest + '.wav')
+
+    if not os.path.exists(wav_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = wav_path + '.tmp'
+
+        subprocess.run(
+            ['mpg321', '-q', '-w', temp_path, path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60, check=True
+        )
+        os.replace(temp_path, wav_path)
+
+    with wave.open(wav_path, 'rb') as wav:
+        return Clip(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels(), wav.getsampwidth())
+
+
+class PipeSink:
+    """
+    Plays PCM through one long running aplay process fed over a pipe. A
+    new process is only started when the sample format changes.
+    """
+
+    FORMATS = {1: 'U8', 2: 'S16_LE', 4: 'S32_LE'}
+
+    realtime = True
+
+    def __init__(self, device=None):
+        """
+        Parameters:
+            device (str): ALSA device to play on, the default one if None
+        """
+
+        self.device = device
+        self._player = None
+        self._format = None
+
+
+    async def write(self, data, rate, channels, width):
+        if (rate, channels, width) != self._format or self._player.returncode is not None:
+            await self._open(rate, channels, width)
+
+        self._player.stdin.write(data)
+        await self._player.stdin.drain()
+
+
+    async def _open(self, rate, channels, width):
+        self.close()
+
+        command = [
+            'aplay', '-q', '-t', 'raw',
+            '-f', self.FORMATS[width], '-r', str(rate), '-c', str(channels),
+            # A short buffer keeps what's written close to what's heard
+            '--buffer-time=100000'
+        ]
+
+        if self.device:
+            command += ['-D', self.device]
+
+        self._player = await asyncio.create_subprocess_exec(
+            *command, '-',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        self._format = (rate, channels, width)
+
+
+    def close(self):
+        if self._player is not None and self._player.returncode is None:
+            try:
+                self._player.stdin.close()
+                self._player.kill()
+            except (OSError, RuntimeError):
+                # aplay already exited
+                pass
+
+        self._player = None
+        self._format = None
+
+
+class AlsaSink:
+    """
+    Plays PCM through a PCM device opened with pyalsaaudio. Writes block
+    until ALSA has room, so they are made on a worker thread.
+    """
+
+    FORMATS = {1: 'PCM_FORMAT_U8', 2: 'PCM_FORMAT_S16_LE', 4: 'PCM_FORMAT_S32_LE'}
+
+    realtime = True
+
+    def __init__(self, device='default'):
+        import alsaaudio
+
+        self._alsaaudio = alsaaudio
+        self.device = device
+        self._pcm = None
+        self._format = None
+
+
+    async def write(self, data, rate, channels, width):
+        if (rate, channels, width) != self._format:
+            self.close()
+            self._pcm = self._alsaaudio.PCM(
+                self._alsaaudio.PCM_PLAYBACK,
+                device=self.device,
+                rate=rate,
+                channels=channels,
+                format=getattr(self._alsaaudio, self.FORMATS[width]),
+                periodsize=rate // 50
+            )
+            self._format = (rate, channels, width)
+
+        await asyncio.get_running_loop().run_in_executor(None, self._pcm.write, data)
+
+
+    def close(self):
+        if self._pcm is not None:
+            self._pcm.close()
+
+        self._pcm = None
+        self._format = None
+
+
+class NullSink:
+    """ Throws sounds away, for running without audio output """
+
+    realtime = False
+
+    async def write(self, data, rate, channels, width):
+        pass
+
+
+    def close(self):
+        pass
+
+
+def create_sink(name=None):
+    """
+    Create the sink sounds are played through
+
+    Parameters:
+        name (str): 'alsa' for pyalsaaudio, 'aplay' for an aplay process
+        or 'null' for no output. Defaults to the QWICKLY_AUDIO environment
+        variable, or the first of those that is available.
+    """
+
+    if name is None:
+        name = os.environ.get('QWICKLY_AUDIO')
+
+    if name == 'alsa':
+        return AlsaSink()
+
+    if name == 'aplay':
+        return PipeSink()
+
+    if name == 'null':
+        return NullSink()
+
+    if name is not None:
+        raise ValueError('unknown audio sink {}'.format(name))
+
+    try:
+        return AlsaSink()
+    except ImportError:
+        pass
+
+    if shutil.which('aplay'):
+        return PipeSink()
+
+    print('no audio output available, sounds are not played')
+    return NullSink()
+
+
+class AudioEngine:
+    """
+    Plays sounds as a task on a Runtime, one at a time. Every mp3 in the
+    sounds directory is decoded once when the engine starts, so playing a
+    sound is only a matter of writing its samples to an output that stays
+    open. While there is nothing to play the task waits for a request.
+
+    Samples are written in CHUNK second pieces and at most AHEAD seconds
+    ahead of what is being heard. Between pieces the sound playing is cut
+    off if a more urgent one is waiting, or any FEEDBACK sound when
+    FEEDBACK is playing. A cut off announcement is played again from the
+    start afterwards.
+
+    Waiting sounds are played most urgent first and in the order they
+    were queued. A sound that is queued while it is already waiting is
+    only played once, and a sound still waiting MAX_AGE seconds after it
+    was queued is dropped. At most MAX_PENDING sounds wait at once, the
+    least urgent and oldest is dropped to make room.
+
+    Attributes:
+        runtime (Runtime): runtime the sounds are played from
+        clips (dict): decoded sounds by path
+    """
+
+    CHUNK = 0.02
+    AHEAD = 0.1
+
+    MAX_AGE = {FEEDBACK: 1.0, ANNOUNCEMENT: 30.0}
+    MAX_PENDING = 8
+
+    def __init__(self, runtime=None, sounds_dir=SOUNDS_PATH, cache_dir=CACHE_PATH, sink=None):
+        """
+        Parameters:
+            runtime (Runtime): runtime to play sounds from, one of its
+            own is started if not given
+            sounds_dir (str): directory of the mp3 files to decode up front
+            cache_dir (str): directory decoded sounds are kept in
+            sink: what sounds are played through, see create_sink
+        """
+
+        self._own_runtime = runtime is None
+        self.runtime = runtime or Runtime().start()
+        self.sounds_dir = sounds_dir
+        self.cache_dir = cache_dir
+        self.sink = sink or create_sink()
+        self.clips = {}
+
+        # When the samples written so far will have been played
+        self._played_until = 0
+
+        # Sounds waiting to be played, only used on the event loop's thread
+        self._pending = []
+        self._order = 0
+
+        # Set when a sound is queued, has to be created on the event loop's thread
+        self._queued = self.runtime.call(asyncio.Event)
+        self._task = self.runtime.spawn(self._run())
+
+
+    def queue(self, path, priority=ANNOUNCEMENT):
+        """
+        Method for adding to queue
+
+        Parameters:
+            path (str): mp3 file of the sound
+            priority (int): FEEDBACK for sounds answering a swipe,
+            ANNOUNCEMENT for everything else
+        """
+
+        self.runtime.call_soon(self._add, path, priority, time.monotonic())
+
+
+    def _add(self, path, priority, queued):
+        deadline = queued + self.MAX_AGE[priority]
+
+        for request in self._pending:
+            if request.path == path:
+                request.deadline = max(request.deadline, deadline)
+                request.priority = min(request.priority, priority)
+                self._queued.set()
+                return
+
+        self._order += 1
+        self._pending.append(_Request(path, priority, self._order, deadline))
+
+        if len(self._pending) > self.MAX_PENDING:
+            self._pending.remove(max(self._pending, key=lambda r: (r.priority, -r.order)))
+
+        self._queued.set()
+
+
+    def _next(self):
+        """ Take the most urgent sound that hasn't expired, or None """
+
+        now = time.monotonic()
+        self._pending = [request for request in self._pending if request.deadline > now]
+
+        if not self._pending:
+            return None
+
+        request = min(self._pending, key=lambda r: (r.priority, r.order))
+        self._pending.remove(request)
+
+        return request
+
+
+    def _preempts(self, playing):
+        """ Whether a waiting sound should cut off the one playing """
+
+        return any(
+            request.priority < playing.priority or request.priority == playing.priority == FEEDBACK
+            for request in self._pending
+        )
+
+
+    def stop(self):
+        self._task.cancel()
+
+        if self._own_runtime:
+            self.runtime.stop()
+
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        try:
+            await loop.run_in_executor(None, self._decode_all)
+
+            while True:
+                request = self._next()
+
+                if request is None:
+                    self._queued.clear()
+                    await self._queued.wait()
+                    continue
+
+                clip = self.clips.get(request.path)
+
+                if clip is None:
+                    clip = await loop.run_in_executor(None, self._decode, request.path)
+
+                if clip is None:
+                    continue
+
+                try:
+                    await self._play(clip, request)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print('can\'t play {}:'.format(request.path), e)
+
+                    # Opened again for the next sound
+                    self.sink.close()
+        finally:
+            self.sink.close()
+
+
+    def _decode_all(self):
+        try:
+            names = sorted(os.listdir(self.sounds_dir))
+        except OSError as e:
+            print(e)
+            return
+
+        for name in names:
+            if name.endswith('.mp3'):
+                self._decode(os.path.join(self.sounds_dir, name))
+
+
+    def _decode(self, path):
+        try:
+            self.clips[path] = decode(path, self.cache_dir)
+        except (OSError, subprocess.SubprocessError, wave.Error) as e:
+            print('can\'t decode {}:'.format(path), e)
+            return None
+
+        return self.clips[path]
+
+
+    async def _play(self, clip, request):
+        frame_size = clip.channels * clip.width
+        chunk_size = max(int(clip.rate * self.CHUNK), 1) * frame_size
+
+        for start in range(0, len(clip.frames), chunk_size):
+            if self._preempts(request):
+                if request.priority != FEEDBACK and request.deadline > time.monotonic():
+                    # Played again once the more urgent sounds are done
+                    self._pending.append(request)
+
+                return
+
+            chunk = clip.frames[start:start + chunk_size]
+
+            await self.sink.write(chunk, clip.rate, clip.channels, clip.width)
+
+            if self.sink.realtime:
+                await self._pace(len(chunk) / frame_size / clip.rate)
+
+
+    async def _pace(self, duration):
+        """ Wait so no more than AHEAD seconds are written but not yet heard """
+
+        now = time.monotonic()
+        self._played_until = max(self._played_until, now) + duration
+        ahead = self._played_until - now
+
+        if ahead > self.AHEAD:
+            await asyncio.sleep(ahead - self.AHEAD)
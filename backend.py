@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+
+class SpiBackend:
+    """
+    Backend used on the Raspberry pi. SPI transactions go through SPI-Py
+    and the reset line of the MFRC522 is driven with RPi.GPIO
+
+    Both modules are only imported when the backend is created so the rest
+    of the reader stack can be used on machines that don't have them.
+    """
+
+    def __init__(self, dev='/dev/spidev0.0', spd=1000000):
+        """
+        Parameters:
+            dev (str): path of the SPI device the MFRC522 is connected to
+            spd (int): SPI clock speed in Hz
+        """
+
+        import spi
+        import RPi.GPIO as GPIO
+
+        self._spi = spi
+        self._gpio = GPIO
+
+        spi.openSPI(device=dev, speed=spd)
+        GPIO.setmode(GPIO.BCM)
+
+
+    def transfer(self, data):
+        """
+        Perform one full-duplex transaction
+
+        Parameters:
+            data (iterable): bytes to clock out on MOSI
+
+        Returns:
+            tuple: bytes clocked in on MISO, same length as data
+        """
+
+        return self._spi.transfer(tuple(data))
+
+
+    def setup_output(self, pin):
+        self._gpio.setup(pin, self._gpio.OUT)
+
+
+    def output(self, pin, value):
+        self._gpio.output(pin, value)
+
+
+    def setup_irq(self, pin):
+        """
+        Watch the IRQ line of the MFRC522. The chip drives it low while an
+        enabled interrupt request is pending
+        """
+
+        self._irq = threading.Event()
+
+        self._gpio.setup(pin, self._gpio.IN, pull_up_down=self._gpio.PUD_UP)
+        self._gpio.add_event_detect(pin, self._gpio.FALLING, callback=lambda channel: self._irq.set())
+
+
+    def clear_irq(self):
+        """ Forget edges seen so far, call before starting a command """
+
+        self._irq.clear()
+
+
+    def wait_irq(self, timeout):
+        """
+        Sleep until the IRQ line is asserted
+
+        Returns:
+            bool: False if timeout seconds passed without an interrupt
+        """
+
+        return self._irq.wait(timeout)
+
+
+    def close(self):
+        """ Release the SPI device and every GPIO pin this process set up """
+
+        self._spi.closeSPI()
+        self._gpio.cleanup()
+
+
+def create_backend(name=None):
+    """
+    Create a reader backend by name
+
+    Parameters:
+        name (str): 'spi' for the hardware backend or 'sim' for a simulated
+        MFRC522 with a card resting on it. Defaults to the QWICKLY_READER
+        environment variable, or 'spi' if that is not set either.
+    """
+
+    if name is None:
+        name = os.environ.get('QWICKLY_READER', 'spi')
+
+    if name == 'spi':
+        return SpiBackend()
+
+    if name == 'sim':
+        from simulator import SimulatedBackend, MifareClassicCard
+
+        backend = SimulatedBackend()
+        backend.place(MifareClassicCard())
+        return backend
+
+    raise ValueError('unknown reader backend {}'.format(name))
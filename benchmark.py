@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Measure card read cost against the simulated MFRC522
+
+Usage:
+    python3 benchmark.py [reads] [latency]
+
+reads - number of card reads to time (default 100)
+latency - seconds every SPI transaction takes (default 0.0001)
+"""
+
+import sys
+import time
+import SimpleMFRC522
+from simulator import SimulatedBackend, MifareClassicCard
+
+
+def measure(backend, action, count):
+    """
+    Run action count times
+
+    Returns:
+        tuple: (milliseconds per call, SPI transactions per call)
+    """
+
+    start_transfers = backend.transfers
+    start = time.perf_counter()
+
+    for i in range(count):
+        action()
+
+    elapsed = time.perf_counter() - start
+    transfers = backend.transfers - start_transfers
+
+    return elapsed * 1000 / count, transfers / count
+
+
+def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0001
+
+    for crc in ('chip', 'host'):
+        backend = SimulatedBackend(latency=latency)
+        reader = SimpleMFRC522.SimpleMFRC522(backend=backend, crc=crc, debounce=0)
+
+        card = MifareClassicCard()
+        card.write_text('qwickly benchmark card')
+
+        def read_card():
+            backend.remove()
+            backend.place(card)
+            reader.read_no_block()
+
+        ms, transfers = measure(backend, reader.read_no_block, reads)
+        print('{} crc, no card:   {:8.2f} ms {:8.1f} transfers'.format(crc, ms, transfers))
+
+        ms, transfers = measure(backend, read_card, reads)
+        print('{} crc, card read: {:8.2f} ms {:8.1f} transfers'.format(crc, ms, transfers))
+
+
+if __name__ == '__main__':
+    main()
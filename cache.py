@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Size bounded mapping that drops its least recently used entries when
+    full and forgets entries once their time to live has passed. Safe to
+    use from several threads.
+
+    Attributes:
+        ttl (float): seconds an entry is kept after it was put
+        max_size (int): most entries kept at once
+    """
+
+    def __init__(self, ttl, max_size, clock=time.monotonic):
+        """
+        Parameters:
+            ttl (float): seconds an entry is kept after it was put
+            max_size (int): most entries kept at once
+            clock (function): source of the current time in seconds
+        """
+
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # key -> (expiry time, value), least recently used first
+        self._entries = OrderedDict()
+
+
+    def get(self, key, default=None):
+        """
+        Returns:
+            The value stored under key, or default if there is none or it
+            has expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return default
+
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+
+    def put(self, key, value=True):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+    def prune(self):
+        """ Drop every expired entry """
+
+        with self._lock:
+            now = self._clock()
+            expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+
+            for key in expired:
+                del self._entries[key]
+
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PersistentTTLCache(TTLCache):
+    """
+    TTLCache kept in a JSON file so it survives restarts. Entries expire by
+    wall clock time since the monotonic clock restarts with the device.
+    Keys and values have to be JSON serializable.
+
+    Changes are written on a background thread save_delay seconds after
+    the first one, so a burst of new entries costs one write and putting
+    an entry never waits for the disk. flush() writes pending changes
+    right away.
+    """
+
+    SAVE_DELAY = 5
+
+    def __init__(self, path, ttl, max_size, save_delay=SAVE_DELAY):
+        """
+        Parameters:
+            path (str): file the entries are stored in
+            ttl (float): seconds an entry is kept after it was put
+            max_size (int): most entries kept at once
+            save_delay (float): seconds changes wait before being written
+        """
+
+        super().__init__(ttl, max_size, clock=time.time)
+        self.path = path
+        self.save_delay = save_delay
+
+        # Serializes writes of the file
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+
+        self.load()
+
+
+    def load(self):
+        """ Read the entries stored on disk, a missing or damaged file is ignored """
+
+        try:
+            with open(self.path, 'r') as cache_file:
+                stored = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+
+        now = self._clock()
+
+        with self._lock:
+            for key, expiry, value in stored[-self.max_size:]:
+                if expiry > now:
+                    self._entries[key] = (expiry, value)
+
+
+    def save(self):
+        """ Write the entries to disk, replacing the old file in one step """
+
+        with self._save_lock:
+            with self._lock:
+                stored = [[key, expiry, value] for key, (expiry, value) in self._entries.items()]
+                self._dirty = False
+
+            temp_path = self.path + '.tmp'
+
+            with open(temp_path, 'w') as cache_file:
+                json.dump(stored, cache_file)
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+
+            os.replace(temp_path, self.path)
+
+
+    def flush(self):
+        """ Write pending changes now instead of after save_delay """
+
+        with self._lock:
+            timer = self._save_timer
+            self._save_timer = None
+            dirty = self._dirty
+
+        if timer is not None:
+            timer.cancel()
+
+        if dirty:
+            self.save()
+
+
+    def put(self, key, value=True):
+        super().put(key, value)
+        self._changed()
+
+
+    def remove(self, key):
+        super().remove(key)
+        self._changed()
+
+
+    def _changed(self):
+        with self._lock:
+            self._dirty = True
+
+            if self._save_timer is not None:
+                return
+
+            self._save_timer = threading.Timer(self.save_delay, self._save_later)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+
+    def _save_later(self):
+        with self._lock:
+            self._save_timer = None
+
+        try:
+            self.save()
+        except OSError as e:
+            print('can\'t save {}:'.format(self.path), e)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import threading
+
+
+CONFIG_PATH = '/home/pi/qwickly/CONFIG.json'
+
+# name -> (type, default), fields without a default are required
+FIELDS = {
+    'id': (str, None),
+    'network': (list, []),
+    'volume': (int, 50),
+    'ping_frequency': (float, 5),
+    'card_debounce': (float, 2),
+    'announce_session_open': (bool, True),
+    'announce_session_close': (bool, True),
+    'custom_active_image': (str, ''),
+    'custom_idle_image': (str, ''),
+    'version': (str, 'latest'),
+    'reader_irq_pin': (int, None),
+    'reader_crc': (str, 'host'),
+    'uid_cache_ttl': (float, 604800),
+    'uid_cache_size': (int, 5000),
+    'batch_window': (float, 0),
+    'http2': (bool, False),
+}
+
+REQUIRED = ('id',)
+
+# Fields that only take one of a few values
+CHOICES = {
+    'reader_crc': ('host', 'chip', 'check'),
+}
+
+# Fields only read when the reader starts, changing them needs a restart
+RESTART_FIELDS = frozenset([
+    'id', 'reader_irq_pin', 'reader_crc', 'uid_cache_ttl', 'uid_cache_size', 'http2'
+])
+
+
+class ConfigError(ValueError):
+    """ Raised for a configuration that doesn't match FIELDS """
+
+
+def validate(data):
+    """
+    Check a configuration against FIELDS
+
+    Parameters:
+        data (dict): the configuration as read from JSON
+
+    Returns:
+        dict: the configuration with missing fields set to their defaults
+        and numbers, also ones written as strings, converted to the
+        field's type. Unknown fields are kept.
+
+    Raises:
+        ConfigError: if a required field is missing or a field has the
+        wrong type or value
+    """
+
+    if not isinstance(data, dict):
+        raise ConfigError('configuration must be a JSON object')
+
+    for name in REQUIRED:
+        if data.get(name) is None:
+            raise ConfigError('{} is missing'.format(name))
+
+    values = dict(data)
+
+    for name, (kind, default) in FIELDS.items():
+        value = data.get(name)
+
+        if value is None:
+            values[name] = default
+            continue
+
+        # Older configurations have numbers written as strings
+        if kind in (int, float) and isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                raise ConfigError('{} must be a number'.format(name))
+
+        # JSON has no separate int and float, and bool is an int in Python
+        if kind in (int, float) and isinstance(value, (int, float)) and not isinstance(value, bool):
+            if kind is int and value != int(value):
+                raise ConfigError('{} must be a whole number'.format(name))
+
+            values[name] = kind(value)
+        elif kind is str and name == 'id' and isinstance(value, int):
+            values[name] = str(value)
+        elif not isinstance(value, kind):
+            raise ConfigError('{} must be {}'.format(name, kind.__name__))
+
+        if name in CHOICES and values[name] not in CHOICES[name]:
+            raise ConfigError('{} must be one of {}'.format(name, ', '.join(CHOICES[name])))
+
+    return values
+
+
+class ConfigStore:
+    """
+    The reader's configuration, read from CONFIG.json once and kept in
+    memory. Fields can be read as attributes (config.ping_frequency) or
+    like a dict (config['ping_frequency']).
+
+    reload() reads the file again only if its modification time or size
+    changed, and passes on only the fields whose value changed, so
+    components can apply new settings while running.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        """
+        Parameters:
+            path (str): configuration file
+
+        Raises:
+            ConfigError: if the file isn't a valid configuration
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+        self._stat = None
+        self._hash = None
+        self._data = {}
+        self._values = {}
+
+        self.reload()
+
+
+    def __getattr__(self, name):
+        if name in FIELDS:
+            return self._values[name]
+
+        raise AttributeError(name)
+
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+
+    def get(self, name, default=None):
+        value = self._values.get(name)
+        return default if value is None else value
+
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: the configuration as written in the file
+        """
+
+        return dict(self._data)
+
+
+    def subscribe(self, fields, function):
+        """
+        Parameters:
+            fields (list): names of the fields to follow
+            function (function): called with the set of changed field
+            names whenever any of fields changes
+        """
+
+        self._subscribers.append((frozenset(fields), function))
+
+
+    def reload(self):
+        """
+        Read the file again if it changed and notify subscribers
+
+        Returns:
+            set: names of the fields whose value changed
+
+        Raises:
+            ConfigError: if the file isn't a valid configuration, the
+            previous configuration is kept
+        """
+
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                raise ConfigError(e)
+
+            if self._stat == (stat.st_mtime_ns, stat.st_size):
+                return set()
+
+            with open(self.path, 'rb') as config_file:
+                raw = config_file.read()
+
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+            digest = hashlib.sha1(raw).hexdigest()
+
+            # Written again with the same contents
+            if digest == self._hash:
+                return set()
+
+            try:
+                data = json.loads(raw.decode())
+            except ValueError as e:
+                raise ConfigError('{} is not valid JSON: {}'.format(self.path, e))
+
+            values = validate(data)
+
+            changed = set(
+                name for name in set(values) | set(self._values)
+                if values.get(name) != self._values.get(name)
+            )
+
+            first = self._hash is None
+            self._hash = digest
+            self._data = data
+            self._values = values
+
+        if not first:
+            for fields, function in self._subscribers:
+                if fields & changed:
+                    try:
+                        function(changed)
+                    except Exception as e:
+                        print(e)
+
+        return changed
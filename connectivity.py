@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# rtnetlink multicast groups for link, address and route changes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+
+class Connectivity:
+    """
+    Keeps track of whether the server can be reached. Requests made to the
+    server anyway report how they went, and that answer is trusted for ttl
+    seconds, or retry seconds if it couldn't be reached. Only when nothing
+    was heard for that long is a TCP connection to the server opened to
+    find out, so a reader that is busy talking to the server never probes.
+
+    On Linux, watch() can also listen for network interface and route
+    changes, which make the next check probe again right away.
+
+    Safe to use from several threads.
+
+    Attributes:
+        host (str): server host name
+        port (int): server port
+    """
+
+    def __init__(self, url, ttl=30, retry=5, timeout=1, clock=time.monotonic):
+        """
+        Parameters:
+            url (str): address of the server
+            ttl (float): seconds the server is trusted to be reachable
+            after it was last heard from
+            retry (float): seconds the server is taken to be unreachable
+            after it last couldn't be reached
+            timeout (float): seconds to wait for a probe connection
+            clock (function): source of the current time in seconds
+        """
+
+        parsed = urlparse(url)
+
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.ttl = ttl
+        self.retry = retry
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._connected = None
+        self._checked = None
+        self._subscribers = []
+        self._netlink = None
+
+
+    def subscribe(self, function):
+        """
+        Parameters:
+            function (function): called with the new state as a bool
+            whenever the server becomes reachable or unreachable
+        """
+
+        self._subscribers.append(function)
+
+
+    def report(self, connected):
+        """
+        Record the outcome of a request to the server
+
+        Parameters:
+            connected (bool): whether the server answered at all, any
+            response counts even if it was an error
+        """
+
+        with self._lock:
+            changed = self._connected is not None and self._connected != connected
+            self._connected = connected
+            self._checked = self._clock()
+
+        if changed:
+            for function in self._subscribers:
+                function(connected)
+
+
+    def invalidate(self):
+        """ Forget the known state so the next check probes """
+
+        with self._lock:
+            self._checked = None
+
+
+    def is_connected(self):
+        """
+        Returns:
+            bool: whether the server can be reached, probing only if the
+            known state is too old to trust
+        """
+
+        with self._lock:
+            if self._checked is not None:
+                age = self._clock() - self._checked
+
+                if age < (self.ttl if self._connected else self.retry):
+                    return self._connected
+
+        connected = self.probe()
+        self.report(connected)
+
+        return connected
+
+
+    def probe(self):
+        """
+        Open a TCP connection to the server
+
+        Returns:
+            bool: whether the connection was accepted within timeout
+        """
+
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+            return True
+        except OSError:
+            return False
+
+
+    def watch(self, runtime):
+        """
+        Listen for network changes on a Runtime's event loop. Does nothing
+        where netlink isn't available.
+
+        Parameters:
+            runtime (Runtime): runtime to listen on
+        """
+
+        runtime.call_soon(self._watch, runtime.loop)
+
+
+    def _watch(self, loop):
+        try:
+            self._netlink = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self._netlink.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+            self._netlink.setblocking(False)
+        except (AttributeError, OSError) as e:
+            print('not watching network changes:', e)
+            self._netlink = None
+            return
+
+        loop.add_reader(self._netlink, self._network_changed)
+
+
+    def _network_changed(self):
+        try:
+            # Only the fact that something changed matters
+            while self._netlink.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print(e)
+
+        self.invalidate()
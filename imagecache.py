@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import hashlib
+import math
+import os
+import tkinter as tk
+
+
+IMAGES_PATH = '/home/pi/qwickly/images'
+CACHE_PATH = '/home/pi/qwickly/image_cache'
+
+
+class ImageCache:
+    """
+    Loads images for a Tk window when they are first shown rather than
+    all up front. Images larger than the screen are scaled down to fit it,
+    and the scaled copy is kept in cache_dir under the hash of the
+    original's contents and the screen size, so each image is only scaled
+    once. Scaling uses Pillow if it is installed, otherwise Tk shrinks the
+    image by a whole factor.
+
+    Must be used from the Tk thread.
+    """
+
+    def __init__(self, master, images_dir=IMAGES_PATH, cache_dir=CACHE_PATH, size=None):
+        """
+        Parameters:
+            master (tk.Tk): window the images are shown in
+            images_dir (str): directory image names are relative to
+            cache_dir (str): directory scaled copies are kept in
+            size (tuple): (width, height) images have to fit in, the
+            screen size if None
+        """
+
+        self.master = master
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.size = size or (master.winfo_screenwidth(), master.winfo_screenheight())
+
+        # name -> PhotoImage
+        self._images = {}
+
+
+    def get(self, name):
+        """
+        Parameters:
+            name (str): file name of the image
+
+        Returns:
+            tk.PhotoImage: the image, scaled to fit if it was too large
+        """
+
+        image = self._images.get(name)
+
+        if image is None:
+            image = self._images[name] = self._load(os.path.join(self.images_dir, name))
+
+        return image
+
+
+    def forget(self, name):
+        """ Drop an image so it's loaded from its file again next time """
+
+        self._images.pop(name, None)
+
+
+    def _load(self, path):
+        with open(path, 'rb') as image_file:
+            digest = hashlib.sha1(image_file.read())
+
+        digest.update('{}x{}'.format(*self.size).encode())
+        cached_path = os.path.join(self.cache_dir, digest.hexdigest() + '.png')
+
+        if os.path.exists(cached_path):
+            return tk.PhotoImage(master=self.master, file=cached_path)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = cached_path + '.tmp'
+
+        try:
+            from PIL import Image
+        except ImportError:
+            image = tk.PhotoImage(master=self.master, file=path)
+            factor = self._factor(image.width(), image.height())
+
+            if factor > 1:
+                image = image.subsample(factor)
+
+            image.write(temp_path, format='png')
+            os.replace(temp_path, cached_path)
+
+            return image
+
+        with Image.open(path) as original:
+            # Only ever shrinks, keeping the aspect ratio
+            original.thumbnail(self.size, Image.LANCZOS)
+            original.save(temp_path, format='PNG')
+
+        os.replace(temp_path, cached_path)
+
+        return tk.PhotoImage(master=self.master, file=cached_path)
+
+
+    def _factor(self, width, height):
+        """ Smallest whole factor that makes an image fit """
+
+        return max(1, math.ceil(width / self.size[0]), math.ceil(height / self.size[1]))
@@ -1,18 +1,12 @@
 #!/usr/bin/env python3
 
 from enum import Enum
-import os
-import time
-import threading
-from queue import Queue
+from collections import deque
+import functools
 import tkinter as tk
-import json
 from squid import *
-
-
-config_file = open('/home/pi/qwickly/CONFIG.json')
-config = json.load(config_file)
-config_file.close()
+from audio import AudioEngine, FEEDBACK
+from imagecache import ImageCache
 
 
 class State(Enum):
@@ -21,41 +15,18 @@ class State(Enum):
     ACTIVE = 2
 
 
-class Sound(threading.Thread):
+def _on_ui_thread(method):
     """
-    Class for outputting sounds in a seperate thread as to not block
-    other functions. Also prevents multiple sounds from playing at once.
-
-    Attributes:
-        q (Queue): queue of sounds waiting their turn to play
-
+    Make an Interface method post its work to the Tk thread instead of
+    doing it right away, so it can be called from any thread
     """
 
-    def __init__(self):
-        self._stop = threading.Event()
-        self.q = Queue()
-
-        threading.Thread.__init__(self)
-        self.name = 'Sound'
-        self.start()
-
-
-    def run(self):
-        while not self._stop.is_set():
-            while not self.q.empty():
-                os.system('mpg321 ' + self.q.get())
-
-
-    def queue(self, path):
-        """
-        Method for adding to queue
-        """
-
-        self.q.put(path)
-
+    @functools.wraps(method)
+    def post(self, *args):
+        # deque appends are atomic, no lock needed
+        self._commands.append((method, args))
 
-    def stop(self):
-        self._stop.set()
+    return post
 
 
 class Interface(tk.Tk):
@@ -63,28 +34,45 @@ class Interface(tk.Tk):
     Class for controlling visible behavior of the device. Manages all
     io threads and ui window
 
+    Tk may only be used from the thread running the mainloop, so state
+    changes and indications are queued and made there every UI_POLL
+    milliseconds. Everything queued in between is drawn once: only the
+    last image and LED color are shown.
+
     Attributes:
         state (State): The current state of the interface. You can read
         this attribute but for writing set_unconfigured(), set_idle()
         and set_active() should be used
     """
 
-    def __init__(self, connected=False):
+    # Milliseconds between checks for queued changes
+    UI_POLL = 20
+
+    def __init__(self, config, connected=False, runtime=None):
         """
-        Interface constructor. Starts io threads and creates instance
+        Interface constructor. Starts io tasks and creates instance
         of tkinter window.
 
         Parameters:
+            config (ConfigStore): configuration, read whenever a setting
+            is needed so changes apply right away
             connected (bool): initial state of interface is unconfigured
             if False or idle if True
+            runtime (Runtime): runtime io tasks are run on, one of their
+            own is started if not given
         """
+
+        self.config = config
         
-        # Start io threads
-        self._sound = Sound()
+        # Start io tasks
+        self._sound = AudioEngine(runtime)
 
         # don't want to announce usb connection over and over
         self.usb_connected = False
 
+        # Pending return to the current state after an indication
+        self._resume_job = None
+
         # Set up tkinter window
         super().__init__()
         self.attributes('-fullscreen', True)
@@ -100,45 +88,47 @@ class Interface(tk.Tk):
         self.protocol('WM_DELETE_WINDOW', self.close)
         self.bind('<Escape>', self.escape)
         
-        # Load images
-        self.images = {
-            'logo': tk.PhotoImage(file='/home/pi/qwickly/images/logo.png'),
-            'config': tk.PhotoImage(file='/home/pi/qwickly/images/config.png'),
-            'active': tk.PhotoImage(file='/home/pi/qwickly/images/active.png'),
-            'idle': tk.PhotoImage(file='/home/pi/qwickly/images/idle.png'),
-            'pending': tk.PhotoImage(file='/home/pi/qwickly/images/pending.png'),
-            'success': tk.PhotoImage(file='/home/pi/qwickly/images/success.png'),
-            'fail': tk.PhotoImage(file='/home/pi/qwickly/images/fail.png')
+        # Images are loaded and scaled to the screen when first shown
+        self.images = ImageCache(self)
+        self._image_files = {
+            'logo': 'logo.png',
+            'config': 'config.png',
+            'pending': 'pending.png',
+            'success': 'success.png',
+            'fail': 'fail.png'
         }
-        
-        if config['custom_idle_image']:
-            self.images['idle'] = tk.PhotoImage(file='/home/pi/qwickly/images/' + config['custom_idle_image'])
-        
-        if config['custom_active_image']:
-            self.images['active'] = tk.PhotoImage(file='/home/pi/qwickly/images/' + config['custom_active_image'])
+
+        # Files that couldn't be loaded, tried again once they're replaced
+        self._broken_images = set()
+
+        self._load_custom_images()
         
         self.img = tk.Label(master=self, image=None, background='white')
         self.img.pack()
         
         self.led = Squid(4, 27, 22)
         
+        # What is shown on screen and the LED right now
+        self._shown_image = None
+        self._shown_color = None
+        
         # initial state can be unconfigured or idle
         if connected:
             self.state = State.IDLE
-            
-            self.led.set_color(PURPLE)
 
             self._sound.queue('/home/pi/qwickly/sounds/phrase8.mp3')
-            self.img.configure(image=self.images['idle'])
-            self.update_idletasks()
+            self._show('idle', PURPLE)
         else:
             self.state = State.UNCONFIGURED
-            
-            self.led.set_color([95, 5, 0])
 
             self._sound.queue('/home/pi/qwickly/sounds/phrase1.mp3')
-            self.img.configure(image=self.images['config'])
-            self.update_idletasks()
+            self._show('config', [95, 5, 0])
+        
+        self._render()
+        
+        # Changes posted from other threads are made on this one
+        self._commands = deque()
+        self._drain_job = self.after(self.UI_POLL, self._drain)
 
 
     def get_entry(self):
@@ -180,107 +170,241 @@ class Interface(tk.Tk):
         self.on_close = function
 
 
+    @_on_ui_thread
+    def load_custom_images(self):
+        """
+        Load the custom idle and active images named in the configuration
+        again, and show the new image if the current state uses one
+        """
+
+        self._load_custom_images()
+
+        # An indication showing now is followed by the new image anyway
+        if self._resume_job is not None:
+            return
+
+        # Shown again even though its name stayed the same
+        self._shown_image = None
+
+        self._resume_state()
+
+
+    def _drain(self):
+        """ Make the queued changes on the Tk thread and draw the result once """
+
+        try:
+            while self._commands:
+                method, args = self._commands.popleft()
+
+                try:
+                    method(self, *args)
+                except Exception as e:
+                    print(e)
+
+            self._render()
+        finally:
+            self._drain_job = self.after(self.UI_POLL, self._drain)
+
+
+    def _show(self, image, color):
+        """ Choose what to show, it's drawn by _render """
+
+        self._image = image
+        self._color = color
+
+
+    def _render(self):
+        """ Draw the chosen image and set the LED, skipping what's already shown """
+
+        if self._image != self._shown_image:
+            image = self._load_image(self._image)
+
+            # Marked shown even if it failed, a broken file is only tried once
+            self._shown_image = self._image
+
+            if image is not None:
+                self.img.configure(image=image)
+                self.update_idletasks()
+
+        if self._color != self._shown_color:
+            self.led.set_color(self._color)
+            self._shown_color = self._color
+
+
+    def _load_image(self, image):
+        """
+        Returns:
+            tk.PhotoImage: the image to show, the stock one if a custom
+            image can't be loaded, or None if neither can
+        """
+
+        names = [self._image_files[image]]
+
+        if image in ('idle', 'active'):
+            names.append(image + '.png')
+
+        for name in names:
+            if name in self._broken_images:
+                continue
+
+            try:
+                return self.images.get(name)
+            except (OSError, tk.TclError) as e:
+                print(e)
+                self._broken_images.add(name)
+
+        return None
+
+
+    def _load_custom_images(self):
+        """
+        Choose the idle and active images, custom ones where the
+        configuration names one. They're read from their files again when
+        next shown, in case a new file was copied over an old one.
+        """
+
+        for state in ('idle', 'active'):
+            old_name = self._image_files.get(state)
+            name = self.config['custom_{}_image'.format(state)] or state + '.png'
+
+            if old_name is not None:
+                self.images.forget(old_name)
+
+            self.images.forget(name)
+            self._broken_images.discard(name)
+            self._image_files[state] = name
+
+
+    @_on_ui_thread
     def set_unconfigured(self):
         """ Set interface state to unconfigured """
 
         if self.state != State.UNCONFIGURED:
             self.state = State.UNCONFIGURED
             self._sound.queue('/home/pi/qwickly/sounds/phrase7.mp3')
-            self.img.configure(image=self.images['config'])
-            self.led.set_color([95, 5, 0])
-            self.update_idletasks()
+            self._show('config', [95, 5, 0])
 
 
+    @_on_ui_thread
     def set_idle(self):
         """ Set interface state to idle """
 
         if self.state != State.IDLE:
-            if config['announce_session_close'] and self.state == State.ACTIVE:
+            if self.config['announce_session_close'] and self.state == State.ACTIVE:
                 self._sound.queue('/home/pi/qwickly/sounds/phrase5.mp3')
             
             if self.state == State.UNCONFIGURED:
                 self._sound.queue('/home/pi/qwickly/sounds/phrase8.mp3')
                 
             self.state = State.IDLE
-            self.img.configure(image=self.images['idle'])
-            self.led.set_color(PURPLE)
-            self.update_idletasks()
+            self._show('idle', PURPLE)
 
 
+    @_on_ui_thread
     def set_active(self):
         """ Set interface state to active """
 
         if self.state != State.ACTIVE:
             self.state = State.ACTIVE
 
-            if config['announce_session_open']:
+            if self.config['announce_session_open']:
                 self._sound.queue('/home/pi/qwickly/sounds/phrase4.mp3')
 
-            self.img.configure(image=self.images['active'])
-            self.led.set_color(WHITE)
-            self.update_idletasks()
+            self._show('active', WHITE)
 
 
+    @_on_ui_thread
     def indicate_pending(self):
         """
         Indicate pending until either indicate_success or
         indicate_failure is called
         """
 
-        self.img.configure(image=self.images['pending'])
-        self.update_idletasks()
-        self.led.set_color(BLUE)
+        self._cancel_resume()
+
+        self._show('pending', BLUE)
 
 
+    @_on_ui_thread
     def indicate_success(self):
-        self.img.configure(image=self.images['success'])
-        self.update_idletasks()
-        self._sound.queue('/home/pi/qwickly/sounds/sound1.mp3')
-        self.led.set_color(GREEN)
+        """
+        Indicate that the card was recorded. Returns right away, the
+        current state is shown again after a moment
+        """
 
-        time.sleep(1.5)
-        
-        self.led.set_color(WHITE)
-        self.img.configure(image=self.images['active'])
-        self.update_idletasks()
+        self._indicate('success', 'sound1.mp3', GREEN, 1500)
 
 
+    @_on_ui_thread
     def indicate_failure(self):
-        self.img.configure(image=self.images['fail'])
-        self.update_idletasks()
-        self._sound.queue('/home/pi/qwickly/sounds/phrase6.mp3')
-        self.led.set_color(RED)
+        """
+        Indicate that the card wasn't recorded. Returns right away, the
+        current state is shown again after a moment
+        """
+
+        self._indicate('fail', 'phrase6.mp3', RED, 2000)
+
+
+    @_on_ui_thread
+    def indicate_duplicate(self):
+        """
+        Indicate that the card was already recorded. Shown like a success
+        but with a teal LED, so the student can tell the tap wasn't
+        recorded a second time. Returns right away, the current state is
+        shown again after a moment
+        """
+
+        self._indicate('success', 'sound1.mp3', [0, 50, 50], 1500)
+
+
+    def _indicate(self, image, sound, color, duration):
+        """
+        Show an indication for duration milliseconds. A newer indication
+        replaces it and starts its own time.
+        """
 
-        time.sleep(2)
+        self._cancel_resume()
+
+        self._sound.queue('/home/pi/qwickly/sounds/' + sound, FEEDBACK)
+        self._show(image, color)
+
+        self._resume_job = self.after(duration, self._resume_state)
+
+
+    def _cancel_resume(self):
+        """ Keep a previous indication from ending the current one """
+
+        if self._resume_job is not None:
+            self.after_cancel(self._resume_job)
+            self._resume_job = None
+
+
+    def _resume_state(self):
+        """ Show the current state again after an indication """
+
+        self._resume_job = None
 
-        # Resume previous state
         if self.state == State.IDLE:
-            self.img.configure(image=self.images['idle'])
-            self.update_idletasks()
-            self.led.set_color(PURPLE)
+            self._show('idle', PURPLE)
 
         if self.state == State.ACTIVE:
-            self.img.configure(image=self.images['active'])
-            self.update_idletasks()
-            self.led.set_color(WHITE)
+            self._show('active', WHITE)
 
         if self.state == State.UNCONFIGURED:
-            self.img.configure(image=self.images['config'])
-            self.update_idletasks()
-            self.led.set_color([95, 5, 0])
+            self._show('config', [95, 5, 0])
 
 
+    @_on_ui_thread
     def indicate_usb_connect(self):
         # Only announce usb config once
         if not self.usb_connected:
             self._sound.queue('/home/pi/qwickly/sounds/phrase2.mp3')
             self.usb_connected = True
 
-        self.img.configure(image=self.images['config'])
-        self.update_idletasks()
-        self.led.set_color([95, 5, 0])
+        self._show('config', [95, 5, 0])
     
     
+    @_on_ui_thread
     def indicate_no_usb(self):
         # Only perform once
         if self.usb_connected:
@@ -291,30 +415,24 @@ class Interface(tk.Tk):
             
             if self.state == State.IDLE:
                 self._sound.queue('/home/pi/qwickly/sounds/phrase8.mp3')
-                self.img.configure(image=self.images['idle'])
-                self.update_idletasks()
-                self.led.set_color(PURPLE)
+                self._show('idle', PURPLE)
             
             if self.state == State.ACTIVE:
-                if config['announce_session_open']:
+                if self.config['announce_session_open']:
                     self._sound.queue('/home/pi/qwickly/sounds/phrase4.mp3')
 
-                self.img.configure(image=self.images['active'])
-                self.update_idletasks()
-                self.led.set_color(WHITE)
+                self._show('active', WHITE)
 
 
+    @_on_ui_thread
     def indicate_reboot(self):
-        self.img.configure(image=self.images['config'])
-        self.update_idletasks()
-        self.led.set_color([95, 5, 0])
+        self._show('config', [95, 5, 0])
         self._sound.queue('/home/pi/qwickly/sounds/phrase3.mp3')
     
     
+    @_on_ui_thread
     def indicate_update(self):
-        self.img.configure(image=self.images['config'])
-        self.update_idletasks()
-        self.led.set_color([95, 5, 0])
+        self._show('config', [95, 5, 0])
         self._sound.queue('/home/pi/qwickly/sounds/phrase9.mp3')
 
 
@@ -324,13 +442,15 @@ class Interface(tk.Tk):
 
 
     def close(self):
+        self.after_cancel(self._drain_job)
+        
         # Execute provided on_close function
         if self.on_close != None:
             self.on_close()
             
         self.led.set_color(OFF)
 
-        # Stop all io threads
+        # Stop all io tasks
         self._sound.stop()
 
         # Close Window
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class Journal:
+    """
+    On-disk record of swipes kept in SQLite. Every swipe is written here
+    before it is submitted and removed once the server has answered, so
+    swipes made while the server can't be reached are kept for replay.
+
+    The database runs in WAL mode with synchronous=FULL: an append is a
+    sequential write to the log followed by one fsync, so a swipe that
+    was recorded survives losing power.
+    """
+
+    # Being submitted right now
+    PENDING = 0
+    # Submission failed, waiting to be replayed
+    FAILED = 1
+
+    def __init__(self, path):
+        """
+        Parameters:
+            path (str): database file
+        """
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS swipes ('
+            'id INTEGER PRIMARY KEY, key TEXT, value TEXT, time REAL, state INTEGER)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS swipes_state ON swipes (state, id)')
+
+        # Swipes that were in flight when the reader last stopped need replaying
+        self._db.execute('UPDATE swipes SET state = ? WHERE state = ?', (self.FAILED, self.PENDING))
+
+
+    def append(self, value, key=None):
+        """
+        Record a swipe as pending
+
+        Parameters:
+            value (str): the card swipe value
+            key (str): idempotency key of the swipe, a new one if not given
+
+        Returns:
+            int: id of the record
+        """
+
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO swipes (key, value, time, state) VALUES (?, ?, ?, ?)',
+                (key or uuid.uuid4().hex, value, time.time(), self.PENDING)
+            )
+
+            return cursor.lastrowid
+
+
+    def complete(self, ids):
+        """ Forget swipes the server has answered """
+
+        with self._lock:
+            self._db.executemany('DELETE FROM swipes WHERE id = ?', [(i,) for i in ids])
+
+
+    def fail(self, ids):
+        """ Mark swipes for replay """
+
+        with self._lock:
+            self._db.executemany(
+                'UPDATE swipes SET state = ? WHERE id = ?',
+                [(self.FAILED, i) for i in ids]
+            )
+
+
+    def failed(self, limit):
+        """
+        Get the oldest swipes waiting for replay
+
+        Returns:
+            list: up to limit (id, key, value, time) tuples
+        """
+
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, key, value, time FROM swipes WHERE state = ? ORDER BY id LIMIT ?',
+                (self.FAILED, limit)
+            ).fetchall()
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Replayer:
+    """
+    Drains swipes waiting in a Journal to the server through a Submitter,
+    in batches when the server supports them. replay_next is meant to be
+    called repeatedly on a thread of its own; after a failed attempt it
+    backs off exponentially before trying again.
+    """
+
+    def __init__(self, journal, submitter, batch_size=50, max_batches=10, min_backoff=5, max_backoff=300):
+        """
+        Parameters:
+            journal (Journal): journal to drain
+            submitter (Submitter): submitter used for posting
+            batch_size (int): swipes loaded from the journal at once
+            max_batches (int): most batches sent per call of replay_next
+            min_backoff (float): seconds to wait after the first failure
+            max_backoff (float): longest wait between attempts
+        """
+
+        self.journal = journal
+        self.submitter = submitter
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self._backoff = min_backoff
+        self._next_attempt = 0
+
+
+    def wake(self):
+        """ Stop backing off, so the next replay_next tries right away """
+
+        self._backoff = self.min_backoff
+        self._next_attempt = 0
+
+
+    def replay_next(self):
+        """ Send up to max_batches batches of waiting swipes """
+
+        if time.monotonic() < self._next_attempt:
+            return
+
+        for i in range(self.max_batches):
+            batch = self.journal.failed(self.batch_size)
+
+            if not batch:
+                return
+
+            results = self.submitter.post_many([(value, swipe_time, key) for record_id, key, value, swipe_time in batch])
+
+            # Whatever the server answered is done with, rejected swipes included
+            self.journal.complete([record[0] for record, r in zip(batch, results) if r is not None])
+
+            if None in results:
+                self._next_attempt = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                return
+
+            self._backoff = self.min_backoff
@@ -1,67 +1,149 @@
 #!/usr/bin/env python3
 
-import requests
 import os
 import time
 import json
-import RPi.GPIO as GPIO
 import SimpleMFRC522
+from backend import create_backend
+from cache import TTLCache, PersistentTTLCache
+from submitter import Submitter
+from connectivity import Connectivity
+from transport import create_session, CHECKIN_TIMEOUT
+from journal import Journal, Replayer
 from interface import *
 from usbconfig import *
-from repeater import *
+from runtime import Runtime
+from sessionchannel import SessionChannel
+from mountwatch import MountWatcher
+from configstore import ConfigStore, ConfigError, RESTART_FIELDS, validate
 from updater import *
 
-config = get_current_config()
+# Read once, reload() picks up changes
+config = ConfigStore()
 
 id = config['id']
-card_receiver = "https://test.qwickly.tools/cardreaderrequest/"
-checkin_receiver = "https://test.qwickly.tools/requestinfo/"
+# QWICKLY_SERVER can point the reader at standin_server.py for testing
+server = os.environ.get('QWICKLY_SERVER', 'https://test.qwickly.tools')
+card_receiver = server + "/cardreaderrequest/"
+batch_receiver = server + "/cardreaderrequest/batch/"
+checkin_receiver = server + "/requestinfo/"
 
-session = requests.Session()
-rfid_reader = SimpleMFRC522.SimpleMFRC522()
+# Swipes and check-ins get connections of their own so a held check-in
+# never keeps a swipe waiting. Swipe posts carry idempotency keys, so
+# they can be retried safely.
+swipe_session = create_session(pool_size=2, retry_posts=True, http2=config.http2)
+checkin_session = create_session(pool_size=1, http2=config.http2)
+
+# Requests to the server double as connectivity checks
+connectivity = Connectivity(server, ttl=max(config.ping_frequency * 2, 30))
+
+# Swipes are recorded here first so none are lost while offline
+journal = Journal('/home/pi/qwickly/journal.db')
+submitter = Submitter(
+    swipe_session, card_receiver, id,
+    journal=journal,
+    batch_url=batch_receiver,
+    batch_window=config.batch_window,
+    connectivity=connectivity
+)
+replayer = Replayer(journal, submitter)
+
+
+def on_connectivity_change(connected):
+    # Send stored swipes as soon as the server is back
+    if connected:
+        replayer.wake()
+
+
+connectivity.subscribe(on_connectivity_change)
+
+# Repeat taps are answered from here without reading the card's sectors
+uid_cache = None
+
+if config.uid_cache_ttl > 0:
+    uid_cache = PersistentTTLCache(
+        '/home/pi/qwickly/uid_cache.json',
+        ttl=config.uid_cache_ttl,
+        max_size=config.uid_cache_size
+    )
+
+reader_backend = create_backend()
+
+rfid_reader = SimpleMFRC522.SimpleMFRC522(
+    backend=reader_backend,
+    uid_cache=uid_cache,
+    irq_pin=config.reader_irq_pin,
+    crc=config.reader_crc,
+    debounce=config.card_debounce
+)
 checked_for_update = False
 
+# Cards recorded recently, holding a card on the reader shouldn't resubmit it
+recent_swipes = TTLCache(ttl=60, max_size=256)
+
 
-def is_connected():
-    # Ping a DNS server to check connection
-    return os.system('ping 8.8.8.8 -c 1 -w 1 -q') == 0
+def succeeded(r):
+    # A stored swipe will be sent once the server can be reached again
+    return r is not None and r.get('Status') in ('success', 'stored')
+
+
+def show_result(r):
+    print(r)
+    
+    if succeeded(r):
+        iface.indicate_success()
+    else:
+        iface.indicate_failure()
 
 
 def read_rfid():
+    # Sleep until a card shows up rather than spinning on the reader
+    if not rfid_reader.wait_for_card(timeout=1):
+        return
+    
     card_id, card_content = rfid_reader.read_no_block()
     
     if card_content:
         print(card_content)
+        
+        swipe = (card_id, card_content)
+        
+        if swipe in recent_swipes:
+            iface.indicate_duplicate()
+            return
+        
         iface.indicate_pending()
         
-        payload = {'device_id':id, 'card_swipe_value': card_content}
-        r = session.post(card_receiver, data=payload).json()
-        print(r)
-                
-        if (r['Status'] == 'success'):
-            iface.indicate_success()
-        else:
-            iface.indicate_failure()
+        # Recorded up front so a card held on the reader isn't queued twice
+        recent_swipes.put(swipe)
+        
+        def on_result(r):
+            if not succeeded(r):
+                recent_swipes.remove(swipe)
+            
+            show_result(r)
+        
+        if not submitter.submit(card_content, on_result):
+            on_result(None)
 
 
 def transmit(event):
     iface.indicate_pending()
     
-    payload = {'device_id':id, 'card_swipe_value':iface.get_entry()}
-    r = session.post(card_receiver, data=payload).json()
-    print(r)
-        
-    if (r['Status'] == 'success'):
-        iface.indicate_success()
-    else:
-        iface.indicate_failure()
+    if not submitter.submit(iface.get_entry(), show_result):
+        show_result(None)
         
     
 def on_close():
-    config_repeater.stop.set()
-    checkin_repeater.stop.set()
-    rfid_repeater.stop.set()
-    GPIO.cleanup()
+    runtime.stop()
+
+    if uid_cache is not None:
+        try:
+            uid_cache.flush()
+        except OSError as e:
+            print(e)
+
+    reader_backend.close()
         
     
 def detect_and_apply_config():
@@ -70,11 +152,30 @@ def detect_and_apply_config():
     if conf:
         iface.indicate_usb_connect()
         
-        if config_needed():
-            perform_config()
-            iface.indicate_reboot()
-            time.sleep(3)
-            os.popen('reboot')
+        if config_needed(conf, config.as_dict()):
+            try:
+                values = validate(dict(conf, id=config.id))
+            except ConfigError as e:
+                print('not applying configuration:', e)
+                return
+            
+            # Settings that running components follow are applied by
+            # their subscribers, only the rest need a reboot. Worked out
+            # before applying, since the periodic reload may pick up the
+            # new file before this one does.
+            restart = any(values[name] != config[name] for name in RESTART_FIELDS)
+            
+            applied = perform_config(conf, config.id, config.as_dict())
+            
+            try:
+                config.reload()
+            except ConfigError as e:
+                print(e)
+            
+            if restart or not applied:
+                iface.indicate_reboot()
+                time.sleep(3)
+                os.popen('reboot')
     
     else:
         iface.indicate_no_usb()
@@ -95,36 +196,73 @@ def check_for_update():
         update()
 
 
-def check_in():
-    if not is_connected():
+def on_session_change(found_open_session):
+    if found_open_session is None:
         iface.set_unconfigured()
         return
     
-    r = session.get(checkin_receiver).json()
-    
-    if r['found_open_session']:
+    if found_open_session:
         iface.set_active()
     else:
         iface.set_idle()
     
     global checked_for_update
     
-    if not r['found_open_session'] and not checked_for_update:
+    if not found_open_session and not checked_for_update:
         check_for_update()
         checked_for_update = True
     
 
-iface = Interface(is_connected())
+# Follows whether a session is open on the server
+session_channel = SessionChannel(
+    checkin_session, checkin_receiver, on_session_change,
+    timeout=CHECKIN_TIMEOUT[1],
+    connectivity=connectivity
+)
+
+def apply_ping_frequency(changed):
+    session_channel.schedule.interval = config.ping_frequency
+    session_channel.schedule.jitter = config.ping_frequency / 2
+    connectivity.ttl = max(config.ping_frequency * 2, 30)
+
+
+def apply_card_debounce(changed):
+    rfid_reader.debounce = config.card_debounce
+
+
+def apply_batch_window(changed):
+    submitter.batch_window = config.batch_window
+
+
+# Settings applied to running components as soon as they change
+config.subscribe(['volume'], lambda changed: set_volume(config.volume))
+config.subscribe(['ping_frequency'], apply_ping_frequency)
+config.subscribe(['card_debounce'], apply_card_debounce)
+config.subscribe(['batch_window'], apply_batch_window)
+config.subscribe(['custom_idle_image', 'custom_active_image'], lambda changed: iface.load_custom_images())
+
+# Background work runs as tasks on one event loop next to the Tk mainloop
+# Enough workers that reading cards never waits behind the other actions
+runtime = Runtime(workers=6).start()
+
+iface = Interface(config, connectivity.is_connected(), runtime)
 iface.set_on_entry(transmit)
 iface.set_on_close(on_close)
 
-config_repeater = Repeater(action=detect_and_apply_config, duration=1)
-config_repeater.start()
+connectivity.watch(runtime)
 
-checkin_repeater = Repeater(action=check_in, duration=int(config['ping_frequency']))
-checkin_repeater.start()
+# Config drives are only looked at when something is mounted or unmounted
+mount_watcher = MountWatcher('/media/pi', detect_and_apply_config)
+mount_watcher.start(runtime)
 
-rfid_repeater = Repeater(action=read_rfid)
-rfid_repeater.start()
+# Session changes are pushed by the server where it can, otherwise
+# check-ins keep to their period and are spread out so readers that
+# powered up together don't all hit the server at the same moment
+runtime.spawn(session_channel.run(runtime, config.ping_frequency, jitter=config.ping_frequency / 2))
+runtime.every(read_rfid)
+runtime.every(submitter.process_next)
+runtime.every(replayer.replay_next, 1)
+# Picks up edits to CONFIG.json made other than through a config drive
+runtime.every(config.reload, 10)
 
 iface.mainloop()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import select
+import threading
+
+
+MOUNTS = '/proc/self/mounts'
+
+
+class MountWatcher:
+    """
+    Calls a function whenever a drive is mounted or unmounted under a
+    directory, and once when started.
+
+    On Linux the kernel signals every change to the mount table through
+    MOUNTS, so nothing is read until something is mounted or unmounted.
+    Watching the directory itself isn't enough, since the mount point is
+    created before the drive is mounted on it. Where the mount table can't
+    be watched the directory is listed every poll_interval seconds instead.
+
+    Attributes:
+        path (str): directory drives are mounted under
+        mounted (set): paths of the drives mounted right now
+    """
+
+    def __init__(self, path, on_change, poll_interval=2):
+        """
+        Parameters:
+            path (str): directory drives are mounted under
+            on_change (function): called without parameters after a drive
+            was mounted or unmounted, may block
+            poll_interval (float): seconds between checks when the mount
+            table can't be watched
+        """
+
+        self.path = path.rstrip('/')
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mounted = None
+
+        self._mounts = None
+        self._epoll = None
+        self._lock = threading.Lock()
+
+
+    def start(self, runtime):
+        """
+        Start watching on a Runtime
+
+        Parameters:
+            runtime (Runtime): runtime to watch on
+        """
+
+        self._runtime = runtime
+        runtime.call_soon(self._start)
+
+
+    def _start(self):
+        try:
+            self._mounts = open(MOUNTS)
+            self._epoll = select.epoll()
+            self._epoll.register(self._mounts, select.EPOLLPRI | select.EPOLLERR)
+        except (AttributeError, OSError) as e:
+            print('not watching mounts, polling {}:'.format(self.path), e)
+            self._close()
+            self._runtime.every(self.check, self.poll_interval)
+            return
+
+        # The epoll file descriptor becomes readable when the mount table changes
+        self._runtime.loop.add_reader(self._epoll.fileno(), self._mounts_changed)
+        self._mounts_changed()
+
+
+    def _mounts_changed(self):
+        self._epoll.poll(0)
+
+        # Read right away, the notification stays up until the table is read
+        self._runtime.loop.run_in_executor(None, self._update, self._read_mounted())
+
+
+    def check(self):
+        """ Call on_change if the drives mounted under path changed """
+
+        self._update(self._read_mounted())
+
+
+    def _update(self, mounted):
+        with self._lock:
+            if mounted == self.mounted:
+                return
+
+            self.mounted = mounted
+
+            try:
+                self.on_change()
+            except Exception as e:
+                print(e)
+
+
+    def _read_mounted(self):
+        if self._mounts is None:
+            try:
+                return set(os.path.join(self.path, name) for name in os.listdir(self.path))
+            except OSError:
+                return set()
+
+        # Reading the table to the end also clears the change notification
+        self._mounts.seek(0)
+        mounted = set()
+
+        for line in self._mounts.read().splitlines():
+            fields = line.split()
+
+            # Spaces and tabs in mount points are octal escaped
+            mount_point = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1])
+
+            if mount_point.startswith(self.path + '/'):
+                mounted.add(mount_point)
+
+        return mounted
+
+
+    def _close(self):
+        if self._epoll is not None:
+            self._runtime.loop.remove_reader(self._epoll.fileno())
+            self._epoll.close()
+            self._epoll = None
+
+        if self._mounts is not None:
+            self._mounts.close()
+            self._mounts = None
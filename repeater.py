@@ -1,29 +1,128 @@
 #!/usr/bin/env python3
 
+import random
 import threading
 import time
 
+
+class Schedule:
+    """
+    Works out when a repeated action should run next.
+
+    At a fixed rate the action is due every interval seconds measured from
+    when it first ran, however long each run took; runs that were missed
+    are skipped rather than made up. With a fixed delay the action waits
+    interval seconds after each run finishes.
+
+    A random jitter of up to jitter seconds is added to every wait, and to
+    the first one, so devices that started at the same moment drift apart.
+    After an action raises, the wait doubles with every failure in a row up
+    to max_backoff, and returns to normal once a run succeeds.
+    """
+
+    FIXED_DELAY = 'delay'
+    FIXED_RATE = 'rate'
+
+    def __init__(self, interval=0, mode=FIXED_DELAY, jitter=0, max_backoff=60, clock=time.monotonic):
+        """
+        Parameters:
+            interval (float): seconds between runs
+            mode (str): FIXED_RATE or FIXED_DELAY
+            jitter (float): most seconds added at random to each wait
+            max_backoff (float): longest wait after failed runs
+            clock (function): source of the current time in seconds
+        """
+
+        self.interval = interval
+        self.mode = mode
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._clock = clock
+
+        self._deadline = None
+        self._failures = 0
+
+
+    def first(self):
+        """
+        Returns:
+            float: seconds to wait before the first run
+        """
+
+        self._deadline = self._clock()
+        return self._jitter()
+
+
+    def next(self, succeeded=True):
+        """
+        Parameters:
+            succeeded (bool): whether the run that just finished succeeded
+
+        Returns:
+            float: seconds to wait before the next run
+        """
+
+        now = self._clock()
+
+        if not succeeded:
+            self._failures += 1
+            backoff = min(max(self.interval, 1) * 2 ** (self._failures - 1), self.max_backoff)
+
+            # Start counting periods again once the action works
+            self._deadline = now + backoff
+            return backoff + self._jitter()
+
+        self._failures = 0
+
+        if self.mode == self.FIXED_DELAY or self._deadline is None or self.interval <= 0:
+            self._deadline = now
+            return self.interval + self._jitter()
+
+        self._deadline += self.interval
+
+        if self._deadline < now:
+            missed = (now - self._deadline) // self.interval + 1
+            self._deadline += missed * self.interval
+
+        return self._deadline - now + self._jitter()
+
+
+    def _jitter(self):
+        return random.uniform(0, self.jitter) if self.jitter > 0 else 0
+
+
 class Repeater(threading.Thread):
     """
     Class for performing a function repeatedly on a separate thread
     """
-    
-    def __init__(self, action, duration=0):
+
+    def __init__(self, action, duration=0, mode=Schedule.FIXED_DELAY, jitter=0, max_backoff=60):
         """
         action - function to be performed
         duration - time in seconds to wait between function calls
+        mode - Schedule.FIXED_DELAY to wait duration after each call,
+        Schedule.FIXED_RATE to call every duration seconds
+        jitter - most seconds added at random to each wait
+        max_backoff - longest wait after the function raised
         """
         threading.Thread.__init__(self)
         self.stop = threading.Event()
         self.action = action
         self.duration = duration
-    
-    
+        self.schedule = Schedule(duration, mode, jitter, max_backoff)
+
+
     def run(self):
+        # Waiting on the stop event lets the thread end as soon as it's set
+        if self.stop.wait(self.schedule.first()):
+            return
+
         while not self.stop.is_set():
-            
-            self.action()
-            
-            if self.duration > 0:
-                time.sleep(self.duration)
+            try:
+                self.action()
+                succeeded = True
+            except Exception as e:
+                print(e)
+                succeeded = False
 
+            self.stop.wait(self.schedule.next(succeeded))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from repeater import Schedule
+
+
+class Runtime:
+    """
+    Event loop running on a thread of its own that the reader's background
+    work is scheduled on as tasks, next to the Tk mainloop on the main
+    thread. Work that blocks (reading the card, talking to the server) is
+    run on a small pool of worker threads and awaited by its task, so only
+    as many threads exist as there is blocking work going on at once.
+
+    Every method may be called from any thread.
+
+    Attributes:
+        loop (AbstractEventLoop): the event loop tasks run on
+    """
+
+    def __init__(self, workers=4):
+        """
+        Parameters:
+            workers (int): most blocking actions running at once
+        """
+
+        self.loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Runtime')
+        self.loop.set_default_executor(self._executor)
+
+        self._thread = threading.Thread(target=self._run, name='Runtime', daemon=True)
+
+
+    def start(self):
+        """
+        Start running the event loop
+
+        Returns:
+            Runtime: this runtime
+        """
+
+        self._thread.start()
+        return self
+
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+
+    def spawn(self, coro):
+        """
+        Run a coroutine as a task on the event loop
+
+        Returns:
+            concurrent.futures.Future: result of the task, cancelling it
+            cancels the task
+        """
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+    def every(self, action, interval=0, blocking=True, mode=Schedule.FIXED_DELAY, jitter=0, max_backoff=60):
+        """
+        Perform an action repeatedly until the runtime stops
+
+        Parameters:
+            action (function): function to be performed
+            interval (float): seconds between calls
+            blocking (bool): whether the action blocks, blocking actions
+            are run on a worker thread
+            mode (str): Schedule.FIXED_DELAY to wait interval after each
+            call, Schedule.FIXED_RATE to call every interval seconds
+            jitter (float): most seconds added at random to each wait
+            max_backoff (float): longest wait after the action raised
+
+        Returns:
+            concurrent.futures.Future: cancel it to stop repeating
+        """
+
+        schedule = Schedule(interval, mode, jitter, max_backoff)
+
+        return self.spawn(self._repeat(action, schedule, blocking))
+
+
+    async def _repeat(self, action, schedule, blocking):
+        await asyncio.sleep(schedule.first())
+
+        while True:
+            try:
+                if blocking:
+                    await self.loop.run_in_executor(None, action)
+                else:
+                    action()
+
+                succeeded = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(e)
+                succeeded = False
+
+            await asyncio.sleep(schedule.next(succeeded))
+
+
+    def call(self, function, *args):
+        """
+        Call a function on the event loop thread and wait for it
+
+        Returns:
+            The function's return value
+        """
+
+        async def call():
+            return function(*args)
+
+        return self.spawn(call()).result()
+
+
+    def call_soon(self, function, *args):
+        """ Call a function on the event loop thread without waiting for it """
+
+        self.loop.call_soon_threadsafe(function, *args)
+
+
+    def stop(self, timeout=5):
+        """
+        Cancel every task, wait up to timeout seconds for them to finish
+        and stop the event loop. Blocking actions still running on a worker
+        thread are left to return on their own.
+        """
+
+        if not self._thread.is_alive():
+            return
+
+        try:
+            self.spawn(self._cancel_tasks()).result(timeout)
+        except Exception as e:
+            print(e)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+
+    async def _cancel_tasks(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
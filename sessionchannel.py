@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+import requests
+from repeater import Schedule
+
+
+class SessionChannel:
+    """
+    Follows whether a session is open on the server.
+
+    Requests are conditional: the server's ETag is sent back in
+    If-None-Match, and an unchanged state is answered with an empty 304.
+    Along with that the server is asked, through a "Prefer: wait=N"
+    header, to hold the request until the state changes. A server that
+    confirms this with Preference-Applied is asked again as soon as it
+    answers, so changes arrive within moments. Otherwise the channel falls
+    back to asking every interval seconds.
+
+    Attributes:
+        open (bool): whether a session is open, None while unknown
+        push (bool): whether the server holds requests until a change
+        schedule (Schedule): when requests are made while the server
+        doesn't hold them, its interval and jitter may be changed
+    """
+
+    def __init__(self, session, url, on_change, wait=20, timeout=10, connectivity=None):
+        """
+        Parameters:
+            session (requests.Session): session used for requests
+            url (str): address session state is requested from
+            on_change (function): called with the new value of open
+            whenever it changes, None meaning the server can't be reached
+            wait (int): seconds the server is asked to hold a request
+            timeout (float): seconds to wait for the server on top of wait
+            connectivity (Connectivity): consulted before and told about
+            every request, if given
+        """
+
+        self.session = session
+        self.url = url
+        self.on_change = on_change
+        self.wait = wait
+        self.timeout = timeout
+        self.connectivity = connectivity
+
+        self.open = None
+        self.push = False
+        self.schedule = Schedule(mode=Schedule.FIXED_RATE)
+        self._etag = None
+
+
+    def poll(self):
+        """
+        Request the session state once, waiting for a change if the server
+        holds requests
+
+        Returns:
+            bool: whether the server held the request, so the next one can
+            be made right away
+        """
+
+        if self.connectivity and not self.connectivity.is_connected():
+            self._set_open(None)
+            return False
+
+        headers = {'Prefer': 'wait={}'.format(self.wait)}
+        timeout = self.timeout
+
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+            timeout += self.wait
+
+        try:
+            response = self.session.get(self.url, headers=headers, timeout=timeout)
+        except requests.RequestException:
+            if self.connectivity:
+                self.connectivity.report(False)
+
+            self._set_open(None)
+            raise
+
+        if self.connectivity:
+            self.connectivity.report(True)
+
+        self.push = 'wait' in response.headers.get('Preference-Applied', '')
+
+        if response.status_code == 304:
+            return self.push
+
+        if response.status_code >= 400:
+            raise requests.HTTPError('{} from {}'.format(response.status_code, self.url))
+
+        self._etag = response.headers.get('ETag')
+        self._set_open(bool(response.json()['found_open_session']))
+
+        return self.push
+
+
+    def _set_open(self, found_open_session):
+        if found_open_session is None:
+            # Ask for the full state once the server is back
+            self._etag = None
+
+        if found_open_session != self.open:
+            self.open = found_open_session
+            self.on_change(found_open_session)
+
+
+    async def run(self, runtime, interval, jitter=0):
+        """
+        Keep requesting the session state on a Runtime until cancelled
+
+        Parameters:
+            runtime (Runtime): runtime whose workers make the requests
+            interval (float): seconds between requests while the server
+            doesn't hold them, or after a request failed
+            jitter (float): most seconds added at random to those waits
+        """
+
+        schedule = self.schedule
+        schedule.interval = interval
+        schedule.jitter = jitter
+
+        await asyncio.sleep(schedule.first())
+
+        while True:
+            started = time.monotonic()
+            etag = self._etag
+
+            try:
+                pushed = await runtime.loop.run_in_executor(None, self.poll)
+                succeeded = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Includes errors from on_change, which runs inside poll
+                print(e)
+                pushed = succeeded = False
+
+            # Unless the state changed, a server that answers straight away
+            # isn't really holding requests
+            if pushed and (self._etag != etag or time.monotonic() - started > 1):
+                continue
+
+            await asyncio.sleep(schedule.next(succeeded))
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+
+def _crc_a(data, preset=0x6363):
+    """ ISO14443A CRC, bit by bit the way the chip coprocessor does it """
+
+    crc = preset
+
+    for byte in data:
+        for bit in range(8):
+            if (crc ^ (byte >> bit)) & 0x01:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc = crc >> 1
+
+    return crc
+
+
+def _append_crc(data):
+    crc = _crc_a(data)
+    return data + [crc & 0xFF, crc >> 8]
+
+
+def _check_crc(frame):
+    return len(frame) > 2 and _append_crc(frame[:-2]) == frame
+
+
+class MifareClassicCard:
+    """
+    MIFARE Classic 1K card as seen over the ISO14443A air interface.
+
+    Authentication is modelled as state only: a successful MFAuthent
+    unlocks one sector until the card is halted or loses the field, the
+    Crypto1 cipher stream itself is not emulated.
+
+    Attributes:
+        uid (list): the 4 byte UID
+        blocks (list): 64 blocks of 16 bytes
+    """
+
+    ATQA = [0x04, 0x00]
+    SAK = 0x08
+
+    IDLE = 0
+    READY = 1
+    ACTIVE = 2
+    HALT = 3
+
+    def __init__(self, uid=(0x12, 0x34, 0x56, 0x78), key=(0xFF,) * 6):
+        """
+        Parameters:
+            uid (iterable): 4 byte UID
+            key (iterable): 6 byte key A and key B of every sector
+        """
+
+        self.uid = list(uid)
+        self.bcc = self.uid[0] ^ self.uid[1] ^ self.uid[2] ^ self.uid[3]
+
+        self.blocks = [[0] * 16 for i in range(64)]
+        self.blocks[0] = self.uid + [self.bcc, self.SAK] + self.ATQA + [0] * 8
+
+        for trailer in range(3, 64, 4):
+            self.blocks[trailer] = list(key) + [0xFF, 0x07, 0x80, 0x69] + list(key)
+
+        self.state = self.IDLE
+        self.halted = False
+        self.auth_sector = None
+        self._write_block = None
+
+
+    def write_text(self, text, block_addrs=(8, 9, 10)):
+        """ Store text in the given blocks the way SimpleMFRC522 writes it """
+
+        data = text.ljust(len(block_addrs) * 16).encode('ascii')
+
+        for i, block_addr in enumerate(block_addrs):
+            self.blocks[block_addr] = list(data[i * 16:(i + 1) * 16])
+
+
+    def leave_field(self):
+        """ Losing power resets the card """
+
+        self.state = self.IDLE
+        self.halted = False
+        self.auth_sector = None
+        self._write_block = None
+
+
+    def _fail(self):
+        # Any unexpected frame sends the card back to where it was woken from
+        self.state = self.HALT if self.halted else self.IDLE
+        self.auth_sector = None
+        self._write_block = None
+
+
+    def authenticate(self, mode, block_addr, key, uid):
+        """
+        Handle the MFAuthent exchange
+
+        Returns:
+            bool: True if the sector of block_addr is now unlocked
+        """
+
+        if self.state != self.ACTIVE or list(uid) != self.uid or block_addr >= 64:
+            self._fail()
+            return False
+
+        trailer = self.blocks[(block_addr // 4) * 4 + 3]
+        expected = trailer[0:6] if mode == 0x60 else trailer[10:16]
+
+        if list(key) != expected:
+            self._fail()
+            return False
+
+        self.auth_sector = block_addr // 4
+        return True
+
+
+    def transceive(self, frame, bits, encrypted=False):
+        """
+        Handle a frame sent by the reader
+
+        Parameters:
+            frame (list): bytes sent by the reader
+            bits (int): number of valid bits in frame
+            encrypted (bool): whether the reader has Crypto1 enabled
+
+        Returns:
+            tuple: (response bytes, number of valid response bits) or None
+            if the card stays silent
+        """
+
+        if bits == 7:
+            return self._request(frame[0])
+
+        if self.state == self.READY:
+            return self._anticoll_select(frame)
+
+        if self.state != self.ACTIVE:
+            return None
+
+        # Reader and card have to agree on the encryption state
+        if encrypted != (self.auth_sector is not None):
+            self._fail()
+            return None
+
+        if not _check_crc(frame):
+            return ([0x01], 4)
+
+        if self._write_block is not None:
+            return self._write_data(frame[:-2])
+
+        command = frame[0]
+
+        if command == 0x50 and frame[1] == 0x00:
+            self.state = self.HALT
+            self.halted = True
+            self.auth_sector = None
+            return None
+
+        if command == 0x30:
+            if self.auth_sector != frame[1] // 4:
+                self._fail()
+                return ([0x04], 4)
+
+            return (_append_crc(list(self.blocks[frame[1]])), 18 * 8)
+
+        if command == 0xA0:
+            if self.auth_sector != frame[1] // 4:
+                self._fail()
+                return ([0x04], 4)
+
+            self._write_block = frame[1]
+            return ([0x0A], 4)
+
+        self._fail()
+        return None
+
+
+    def _request(self, command):
+        if command == 0x26 and self.state == self.IDLE:
+            self.halted = False
+        elif command == 0x52 and self.state in (self.IDLE, self.HALT):
+            self.halted = self.state == self.HALT
+        else:
+            self._fail()
+            return None
+
+        self.state = self.READY
+        self.auth_sector = None
+        return (list(self.ATQA), 16)
+
+
+    def _anticoll_select(self, frame):
+        if frame == [0x93, 0x20]:
+            return (self.uid + [self.bcc], 40)
+
+        if frame[:2] == [0x93, 0x70] and frame[2:7] == self.uid + [self.bcc] and _check_crc(frame):
+            self.state = self.ACTIVE
+            return (_append_crc([self.SAK]), 24)
+
+        self._fail()
+        return None
+
+
+    def _write_data(self, data):
+        block_addr = self._write_block
+        self._write_block = None
+
+        if len(data) != 16:
+            self._fail()
+            return ([0x04], 4)
+
+        self.blocks[block_addr] = list(data)
+        return ([0x0A], 4)
+
+
+class MFRC522Chip:
+    """
+    Register level model of the MFRC522 covering what the driver uses:
+    the FIFO, CommIrqReg/DivIrqReg, the CRC coprocessor, Transceive and
+    MFAuthent. Commands complete as soon as they are started, a card that
+    stays silent raises TimerIRq like the chip does once TReload expires.
+
+    Attributes:
+        card (MifareClassicCard): card in the field, or None
+    """
+
+    CommandReg = 0x01
+    CommIEnReg = 0x02
+    DivIEnReg = 0x03
+    CommIrqReg = 0x04
+    DivIrqReg = 0x05
+    ErrorReg = 0x06
+    Status2Reg = 0x08
+    FIFODataReg = 0x09
+    FIFOLevelReg = 0x0A
+    ControlReg = 0x0C
+    BitFramingReg = 0x0D
+    ModeReg = 0x11
+    TxControlReg = 0x14
+    CRCResultRegM = 0x21
+    CRCResultRegL = 0x22
+    TModeReg = 0x2A
+    VersionReg = 0x37
+
+    IDLE = 0x00
+    CALCCRC = 0x03
+    TRANSMIT = 0x04
+    TRANSCEIVE = 0x0C
+    AUTHENT = 0x0E
+    SOFTRESET = 0x0F
+
+    FIFO_SIZE = 64
+
+    def __init__(self):
+        self.card = None
+        self.reset()
+
+
+    def reset(self):
+        self.regs = [0] * 64
+        self.regs[self.CommIEnReg] = 0x80
+        self.regs[self.CommIrqReg] = 0x14
+        self.regs[self.ModeReg] = 0x3F
+        self.regs[self.TxControlReg] = 0x80
+        self.regs[self.VersionReg] = 0x92
+        self.fifo = []
+        self.command = self.IDLE
+
+
+    def irq(self):
+        """ Whether an enabled interrupt request is pending """
+
+        return bool(
+            (self.regs[self.CommIEnReg] & self.regs[self.CommIrqReg] & 0x7F) or
+            (self.regs[self.DivIEnReg] & self.regs[self.DivIrqReg] & 0x14)
+        )
+
+
+    def read(self, addr):
+        if addr == self.FIFODataReg:
+            return self.fifo.pop(0) if self.fifo else 0
+
+        if addr == self.FIFOLevelReg:
+            return len(self.fifo)
+
+        if addr == self.CommandReg:
+            return (self.regs[addr] & 0xF0) | self.command
+
+        return self.regs[addr]
+
+
+    def write(self, addr, val):
+        if addr == self.CommandReg:
+            self.regs[addr] = val & 0xF0
+            self._execute(val & 0x0F)
+
+        elif addr == self.FIFODataReg:
+            if len(self.fifo) < self.FIFO_SIZE:
+                self.fifo.append(val)
+            else:
+                self.regs[self.ErrorReg] |= 0x10
+
+        elif addr == self.FIFOLevelReg:
+            if val & 0x80:
+                self.fifo = []
+                self.regs[self.ErrorReg] &= ~0x10
+
+        elif addr in (self.CommIrqReg, self.DivIrqReg):
+            # Bit 7 selects whether the written 1 bits are set or cleared
+            if val & 0x80:
+                self.regs[addr] |= val & 0x7F
+            else:
+                self.regs[addr] &= ~(val & 0x7F)
+
+        elif addr == self.Status2Reg:
+            # MFCrypto1On can only be cleared by the host
+            crypto = self.regs[addr] & val & 0x08
+            self.regs[addr] = (val & 0xC0) | crypto | (self.regs[addr] & 0x07)
+
+        elif addr == self.BitFramingReg:
+            self.regs[addr] = val & 0x7F
+
+            if val & 0x80 and self.command == self.TRANSCEIVE:
+                self._transceive()
+
+        else:
+            self.regs[addr] = val
+
+
+    def _execute(self, command):
+        self.command = command
+
+        if command == self.SOFTRESET:
+            card = self.card
+            self.reset()
+            self.card = card
+
+        elif command == self.CALCCRC:
+            preset = [0x0000, 0x6363, 0xA671, 0xFFFF][self.regs[self.ModeReg] & 0x03]
+            crc = _crc_a(self.fifo, preset)
+            self.fifo = []
+            self.regs[self.CRCResultRegM] = crc >> 8
+            self.regs[self.CRCResultRegL] = crc & 0xFF
+            self.regs[self.DivIrqReg] |= 0x04
+
+        elif command == self.TRANSMIT:
+            frame = self.fifo
+            self.fifo = []
+            self.command = self.IDLE
+
+            if self._field_on():
+                self.card.transceive(frame, len(frame) * 8, bool(self.regs[self.Status2Reg] & 0x08))
+
+            self.regs[self.CommIrqReg] |= 0x50
+
+        elif command == self.AUTHENT:
+            data = self.fifo[0:12]
+            self.fifo = self.fifo[12:]
+            self.command = self.IDLE
+
+            if self._field_on() and len(data) == 12 and \
+                    self.card.authenticate(data[0], data[1], data[2:8], data[8:12]):
+                self.regs[self.Status2Reg] |= 0x08
+                self.regs[self.CommIrqReg] |= 0x10
+            else:
+                self._timeout()
+
+
+    def _field_on(self):
+        return self.card is not None and self.regs[self.TxControlReg] & 0x03
+
+
+    def _timeout(self):
+        # The timer only starts by itself at the end of a transmission when TAuto is set
+        if self.regs[self.TModeReg] & 0x80:
+            self.regs[self.CommIrqReg] |= 0x01
+
+
+    def _transceive(self):
+        frame = self.fifo
+        self.fifo = []
+
+        last_bits = self.regs[self.BitFramingReg] & 0x07
+        bits = (len(frame) - 1) * 8 + last_bits if last_bits else len(frame) * 8
+
+        self.regs[self.ErrorReg] = 0
+        self.regs[self.CommIrqReg] |= 0x40
+
+        response = None
+
+        if self._field_on():
+            encrypted = bool(self.regs[self.Status2Reg] & 0x08)
+            response = self.card.transceive(frame, bits, encrypted)
+
+        if response is None:
+            self._timeout()
+            return
+
+        data, rx_bits = response
+        self.fifo = list(data[:self.FIFO_SIZE])
+        self.regs[self.ControlReg] = (self.regs[self.ControlReg] & 0xF8) | (rx_bits % 8)
+        self.regs[self.CommIrqReg] |= 0x20
+
+
+class SimulatedBackend:
+    """
+    Reader backend that routes SPI transactions to an MFRC522Chip instead
+    of the SPI device, for running and benchmarking the reader off-device.
+
+    Attributes:
+        chip (MFRC522Chip): the simulated chip
+        latency (float): seconds every transaction takes
+        transfers (int): number of transactions performed
+    """
+
+    def __init__(self, chip=None, latency=0.0, reset_pin=25):
+        self.chip = chip if chip is not None else MFRC522Chip()
+        self.latency = latency
+        self.reset_pin = reset_pin
+        self.transfers = 0
+        self.pins = {}
+        self._lock = threading.Lock()
+        self._irq = threading.Event()
+        self._irq_level = False
+
+
+    def place(self, card):
+        """ Put a card in the field """
+
+        with self._lock:
+            self.chip.card = card
+
+
+    def remove(self):
+        """ Take the card out of the field """
+
+        with self._lock:
+            if self.chip.card is not None:
+                self.chip.card.leave_field()
+
+            self.chip.card = None
+
+
+    def transfer(self, data):
+        data = list(data)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.transfers += 1
+
+            reg = (data[0] >> 1) & 0x3F
+            result = [0]
+
+            if data[0] & 0x80:
+                # Every byte addresses the register answered in the next one
+                for byte in data[1:]:
+                    result.append(self.chip.read(reg))
+                    reg = (byte >> 1) & 0x3F
+            else:
+                for byte in data[1:]:
+                    self.chip.write(reg, byte)
+                    result.append(0)
+
+            # Only a new interrupt request produces an edge on the IRQ line
+            irq_level = self.chip.irq()
+
+            if irq_level and not self._irq_level:
+                self._irq.set()
+
+            self._irq_level = irq_level
+
+        return tuple(result)
+
+
+    def setup_output(self, pin):
+        self.pins[pin] = 0
+
+
+    def output(self, pin, value):
+        # Releasing the reset line restarts the chip
+        with self._lock:
+            if pin == self.reset_pin and not self.pins.get(pin) and value:
+                card = self.chip.card
+                self.chip.reset()
+                self.chip.card = card
+
+            self.pins[pin] = value
+
+
+    def setup_irq(self, pin):
+        pass
+
+
+    def clear_irq(self):
+        self._irq.clear()
+
+
+    def wait_irq(self, timeout):
+        return self._irq.wait(timeout)
+
+
+    def close(self):
+        pass
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the qwickly tools server, for trying the card reader
+without touching the real backend.
+
+Usage:
+    python3 standin_server.py [--port 8000] [--latency 0.2] [--no-batch] [--no-push] [--open]
+
+Then start the reader with:
+    QWICKLY_SERVER=http://localhost:8000 python3 main.py
+
+Card swipe values containing "fail" are rejected, everything else is
+accepted. A swipe posted again with the same idempotency key is only
+recorded once. Sessions are opened and closed with:
+    curl -X POST http://localhost:8000/session/open/
+    curl -X POST http://localhost:8000/session/close/
+"""
+
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandinState:
+    """
+    What the stand-in server has seen and what it answers with
+
+    Attributes:
+        swipes (list): (device_id, card_swipe_value, swipe_time) tuples received
+        requests (int): number of requests handled
+        session_open (bool): whether check-ins report an open session
+        latency (float): seconds every request is delayed by
+        batch (bool): whether the batch endpoint exists
+        push (bool): whether check-ins are held until the session changes
+        version (int): counts session changes, sent as the ETag
+    """
+
+    def __init__(self, latency=0.0, batch=True, session_open=False, push=True):
+        self.swipes = []
+        self.answers = {}
+        self.requests = 0
+        self.session_open = session_open
+        self.latency = latency
+        self.batch = batch
+        self.push = push
+        self.version = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+
+    def set_session(self, session_open):
+        with self.lock:
+            if session_open != self.session_open:
+                self.session_open = session_open
+                self.version += 1
+                self.changed.notify_all()
+
+        print('session', 'open' if session_open else 'closed')
+
+
+    def etag(self):
+        return '"{}"'.format(self.version)
+
+
+    def record(self, device_id, value, swipe_time=None, key=None):
+        """ Record a swipe, a swipe whose key was seen before gets the same answer again """
+
+        with self.lock:
+            if key in self.answers:
+                return self.answers[key]
+
+            self.swipes.append((device_id, value, swipe_time))
+            answer = {'Status': 'failure' if 'fail' in value else 'success'}
+
+            if key:
+                self.answers[key] = answer
+
+        print('swipe from {}: {}'.format(device_id, value))
+
+        return answer
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    state = None
+
+    def do_GET(self):
+        self._begin()
+
+        if urlparse(self.path).path == '/requestinfo/':
+            self._send_session()
+        else:
+            self.send_error(404)
+
+
+    def _send_session(self):
+        """ Answer a check-in, holding it while the session is unchanged if asked to """
+
+        if not self.state.push:
+            self._send_json({'found_open_session': self.state.session_open})
+            return
+
+        known = self.headers.get('If-None-Match')
+        wait = re.search(r'wait=(\d+)', self.headers.get('Prefer', ''))
+
+        with self.state.lock:
+            if wait:
+                self.state.changed.wait_for(lambda: self.state.etag() != known, timeout=int(wait.group(1)))
+
+            headers = {'ETag': self.state.etag()}
+            session_open = self.state.session_open
+
+        if wait:
+            headers['Preference-Applied'] = 'wait=' + wait.group(1)
+
+        if headers['ETag'] != known:
+            self._send_json({'found_open_session': session_open}, headers)
+            return
+
+        self.send_response(304)
+
+        for header, value in headers.items():
+            self.send_header(header, value)
+
+        self.end_headers()
+
+
+    def do_POST(self):
+        self._begin()
+
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if path == '/cardreaderrequest/':
+            form = parse_qs(body.decode())
+            swipe_time = form.get('swipe_time', [None])[0]
+            self._send_json(self.state.record(
+                form['device_id'][0], form['card_swipe_value'][0], swipe_time, self.headers.get('Idempotency-Key')
+            ))
+
+        elif path in ('/session/open/', '/session/close/'):
+            self.state.set_session(path == '/session/open/')
+            self._send_json({'found_open_session': self.state.session_open})
+
+        elif path == '/cardreaderrequest/batch/' and self.state.batch:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+
+            batch = json.loads(body)
+            results = [
+                self.state.record(batch['device_id'], swipe['card_swipe_value'], swipe.get('swipe_time'), swipe.get('key'))
+                for swipe in batch['swipes']
+            ]
+            self._send_json({'results': results})
+
+        else:
+            self.send_error(404)
+
+
+    def _begin(self):
+        with self.state.lock:
+            self.state.requests += 1
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+
+    def _send_json(self, data, headers={}):
+        body = json.dumps(data).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for header, value in headers.items():
+            self.send_header(header, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8000, state=None):
+    """
+    Start the stand-in server on a background thread
+
+    Returns:
+        ThreadingHTTPServer: the running server, call shutdown() to stop it
+    """
+
+    handler = type('Handler', (StandinHandler,), {'state': state or StandinState()})
+    server = ThreadingHTTPServer(('localhost', port), handler)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the qwickly tools server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every request is delayed by')
+    parser.add_argument('--no-batch', action='store_true', help='leave out the batch endpoint')
+    parser.add_argument('--no-push', action='store_true', help='answer check-ins right away without ETags')
+    parser.add_argument('--open', action='store_true', help='report an open session on check-in')
+    args = parser.parse_args()
+
+    state = StandinState(
+        latency=args.latency,
+        batch=not args.no_batch,
+        session_open=args.open,
+        push=not args.no_push
+    )
+    server = serve(args.port, state)
+
+    print('serving on http://localhost:{}'.format(args.port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
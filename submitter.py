@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import queue
+import time
+import uuid
+import requests
+from transport import SWIPE_TIMEOUT, BATCH_TIMEOUT
+
+
+# Response passed on for a swipe that couldn't be posted but is kept in
+# the journal for replay
+STORED = {'Status': 'stored'}
+
+
+class Submitter:
+    """
+    Sends card swipes to the server away from the threads that capture
+    them. Swipes wait in a bounded queue and are posted by process_next,
+    which is meant to be called repeatedly on a thread of its own.
+
+    With a journal every swipe is recorded before it is queued. Swipes that
+    can't be posted stay in the journal for a Replayer to send later.
+
+    Every swipe gets a unique key, sent as the Idempotency-Key header, so
+    the server can recognise a swipe that is posted again after its
+    response was lost.
+
+    With a batch url, swipes that pile up while a request is in flight (or
+    arrive within batch_window) are sent together as one gzipped JSON
+    request. If the server doesn't know the batch endpoint, swipes are
+    posted one by one from then on.
+
+    Attributes:
+        q (Queue): swipes waiting to be posted
+    """
+
+    def __init__(self, session, url, device_id, timeout=SWIPE_TIMEOUT, max_pending=64, journal=None,
+                 batch_url=None, batch_window=0, max_batch=50, connectivity=None, batch_timeout=BATCH_TIMEOUT):
+        """
+        Parameters:
+            session (requests.Session): session used for posting
+            url (str): address swipes are posted to
+            device_id (str): id of this card reader
+            timeout (tuple): (connect, read) seconds to wait for the server
+            max_pending (int): most swipes waiting at once
+            journal (Journal): journal swipes are recorded in, if any
+            batch_url (str): address batches of swipes are posted to, if any
+            batch_window (float): seconds to wait for more swipes to join a batch
+            max_batch (int): most swipes sent in one batch
+            connectivity (Connectivity): told how every request went, if given
+            batch_timeout (tuple): (connect, read) seconds to wait for the
+            server to answer a batch
+        """
+
+        self.session = session
+        self.url = url
+        self.device_id = device_id
+        self.timeout = timeout
+        self.batch_timeout = batch_timeout
+        self.journal = journal
+        self.batch_url = batch_url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.connectivity = connectivity
+        self.q = queue.Queue(maxsize=max_pending)
+
+
+    def submit(self, value, on_result):
+        """
+        Queue a swipe for posting
+
+        Parameters:
+            value (str): the card swipe value
+            on_result (function): called with the server's response as a
+            dict, STORED if the swipe was kept in the journal instead, or
+            None if there was no usable response
+
+        Returns:
+            bool: False if the queue is full and the swipe was dropped
+        """
+
+        key = uuid.uuid4().hex
+        record_id = self.journal.append(value, key) if self.journal else None
+
+        try:
+            self.q.put_nowait((record_id, key, value, on_result))
+        except queue.Full:
+            if not self.journal:
+                return False
+
+            self.journal.fail([record_id])
+            on_result(STORED)
+
+        return True
+
+
+    def process_next(self, timeout=1):
+        """
+        Post the next queued swipes, waiting up to timeout seconds for one
+        """
+
+        try:
+            items = [self.q.get(timeout=timeout)]
+        except queue.Empty:
+            return
+
+        if self.batch_url:
+            items += self._collect_batch()
+
+        results = self.post_many([(value, None, key) for record_id, key, value, on_result in items])
+
+        for (record_id, key, value, on_result), r in zip(items, results):
+            if self.journal:
+                if r is None:
+                    self.journal.fail([record_id])
+                    r = STORED
+                else:
+                    self.journal.complete([record_id])
+
+            on_result(r)
+
+
+    def _collect_batch(self):
+        """ Take the swipes joining the one already taken from the queue """
+
+        items = []
+        deadline = time.monotonic() + self.batch_window
+
+        while len(items) + 1 < self.max_batch:
+            try:
+                items.append(self.q.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+
+        return items
+
+
+    def post_many(self, swipes):
+        """
+        Post several swipes, as a batch if possible
+
+        Parameters:
+            swipes (list): (value, swipe_time, key) tuples, swipe_time is
+            None for swipes made just now
+
+        Returns:
+            list: a response or None for every swipe, in order. After the
+            first failed post the remaining swipes aren't attempted.
+        """
+
+        if self.batch_url and len(swipes) > 1:
+            results = self.post_batch(swipes)
+
+            if results is not None:
+                return results
+
+            # Unless the endpoint turned out to be missing the server can't be reached
+            if self.batch_url:
+                return [None] * len(swipes)
+
+        results = []
+
+        for value, swipe_time, key in swipes:
+            r = self.post(value, swipe_time, key)
+            results.append(r)
+
+            if r is None:
+                break
+
+        return results + [None] * (len(swipes) - len(results))
+
+
+    def post(self, value, swipe_time=None, key=None):
+        """
+        Post a single swipe, key is its idempotency key
+
+        Returns:
+            dict: the server's response, or None if the request failed
+        """
+
+        payload = {'device_id': self.device_id, 'card_swipe_value': value}
+
+        if swipe_time is not None:
+            payload['swipe_time'] = swipe_time
+
+        headers = {'Idempotency-Key': key} if key else {}
+
+        response = self._send(self.url, self.timeout, data=payload, headers=headers)
+
+        try:
+            return response.json() if response is not None else None
+        except ValueError as e:
+            print(e)
+            return None
+
+
+    def post_batch(self, swipes):
+        """
+        Post several swipes in one gzipped JSON request
+
+        Returns:
+            list: the server's response for every swipe, in order, or None
+            if the request failed
+        """
+
+        body = {
+            'device_id': self.device_id,
+            'swipes': [
+                {'card_swipe_value': value, 'swipe_time': swipe_time or time.time(), 'key': key}
+                for value, swipe_time, key in swipes
+            ]
+        }
+
+        # The same swipes in the same order make the same batch
+        batch_key = uuid.uuid5(uuid.NAMESPACE_OID, ','.join(str(key) for value, swipe_time, key in swipes)).hex
+
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip', 'Idempotency-Key': batch_key}
+
+        response = self._send(
+            self.batch_url, self.batch_timeout,
+            data=gzip.compress(json.dumps(body).encode()),
+            headers=headers
+        )
+
+        if response is None:
+            return None
+
+        if response.status_code in (404, 405):
+            # The server has no batch endpoint
+            print('batch endpoint not available, posting swipes one by one')
+            self.batch_url = None
+            return None
+
+        try:
+            results = response.json()['results']
+        except (ValueError, KeyError) as e:
+            print(e)
+            return None
+
+        if len(results) != len(swipes):
+            print('batch response has {} results for {} swipes'.format(len(results), len(swipes)))
+            return None
+
+        return results
+
+
+    def _send(self, url, timeout, **kwargs):
+        """
+        Post to the server, reporting the outcome to connectivity
+
+        Returns:
+            requests.Response: the response, or None if the server
+            couldn't be reached
+        """
+
+        try:
+            response = self.session.post(url, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            print(e)
+
+            if self.connectivity:
+                self.connectivity.report(False)
+
+            return None
+
+        if self.connectivity:
+            self.connectivity.report(True)
+
+        return response
@@ -0,0 +1,47 @@
+import os
+import socket
+import sys
+import pytest
+import requests
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standin_server import StandinState, serve
+
+
+def free_port():
+    """ A port nothing is listening on """
+
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as s:
+        yield s
+
+
+@pytest.fixture
+def standin():
+    """
+    Start stand-in servers, shut down after the test. Called with the
+    port to listen on (any free one if 0) and StandinState arguments,
+    returns (state, base url).
+    """
+
+    servers = []
+
+    def start(port=0, **kwargs):
+        state = StandinState(**kwargs)
+        server = serve(port, state)
+        servers.append(server)
+        return state, 'http://localhost:{}'.format(server.server_address[1])
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,109 @@
+import time
+import pytest
+from audio import AudioEngine, Clip, FEEDBACK, ANNOUNCEMENT
+
+
+class RecordingSink:
+    """ Keeps which sound every written piece came from, played in real time """
+
+    realtime = True
+
+    def __init__(self):
+        self.written = []
+
+    async def write(self, data, rate, channels, width):
+        self.written.append(chr(data[0]))
+
+    def close(self):
+        pass
+
+    def played(self):
+        """ Sounds in the order they were heard, repeats of a piece merged """
+
+        played = []
+
+        for name in self.written:
+            if not played or played[-1] != name:
+                played.append(name)
+
+        return played
+
+
+def clip(name, seconds):
+    # 8 bit mono at 1 kHz, every sample is the sound's name
+    return Clip(name.encode() * int(seconds * 1000), 1000, 1, 1)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    sink = RecordingSink()
+    engine = AudioEngine(sounds_dir=str(tmp_path), cache_dir=str(tmp_path), sink=sink)
+
+    yield engine, sink
+
+    engine.stop()
+
+
+def wait_until_quiet(sink, quiet=0.3, limit=10):
+    deadline = time.monotonic() + limit
+    count = -1
+
+    while count != len(sink.written) and time.monotonic() < deadline:
+        count = len(sink.written)
+        time.sleep(quiet)
+
+
+def test_feedback_cuts_off_announcement(engine):
+    engine, sink = engine
+    engine.clips.update({'A': clip('A', 0.5), 'B': clip('B', 0.1), 'F': clip('F', 0.1)})
+
+    engine.queue('A')
+    time.sleep(0.15)
+    engine.queue('B')
+    engine.queue('F', FEEDBACK)
+    wait_until_quiet(sink)
+
+    # The cut off announcement starts again before the next one
+    assert sink.played() == ['A', 'F', 'A', 'B']
+
+
+def test_sound_queued_twice_plays_once(engine):
+    engine, sink = engine
+    engine.clips.update({'A': clip('A', 0.3), 'B': clip('B', 0.1)})
+
+    engine.queue('A')
+    time.sleep(0.1)
+    engine.queue('B')
+    engine.queue('B')
+    wait_until_quiet(sink)
+
+    assert sink.played() == ['A', 'B']
+
+
+def test_sound_waiting_too_long_is_dropped(engine):
+    engine, sink = engine
+    engine.MAX_AGE = {FEEDBACK: 1.0, ANNOUNCEMENT: 0.1}
+    engine.clips.update({'A': clip('A', 0.4), 'B': clip('B', 0.1)})
+
+    engine.queue('A')
+    time.sleep(0.1)
+    engine.queue('B')
+    wait_until_quiet(sink)
+
+    assert sink.played() == ['A']
+
+
+def test_oldest_waiting_sound_is_dropped_when_full(engine):
+    engine, sink = engine
+    engine.MAX_PENDING = 2
+    engine.clips.update({'A': clip('A', 0.3), 'B': clip('B', 0.05), 'C': clip('C', 0.05), 'D': clip('D', 0.05)})
+
+    engine.queue('A')
+    time.sleep(0.1)
+
+    for name in 'BCD':
+        engine.queue(name)
+
+    wait_until_quiet(sink)
+
+    assert sink.played() == ['A', 'C', 'D']
@@ -0,0 +1,57 @@
+import gzip
+import json
+import requests
+from submitter import Submitter
+
+
+def make_submitter(session, base, **kwargs):
+    return Submitter(session, base + '/cardreaderrequest/', 'reader-1', **kwargs)
+
+
+def test_queued_swipes_are_batched(session, standin):
+    state, base = standin()
+    submitter = make_submitter(session, base, batch_url=base + '/cardreaderrequest/batch/', batch_window=0.1)
+    results = []
+
+    for value in ('card-1', 'card-2', 'card-3'):
+        submitter.submit(value, results.append)
+
+    submitter.process_next()
+
+    assert results == [{'Status': 'success'}] * 3
+    assert state.requests == 1
+    assert [swipe[1] for swipe in state.swipes] == ['card-1', 'card-2', 'card-3']
+
+
+def test_missing_batch_endpoint_posts_one_by_one(session, standin):
+    state, base = standin(batch=False)
+    submitter = make_submitter(session, base, batch_url=base + '/cardreaderrequest/batch/')
+    results = submitter.post_many([('card-1', None, 'a'), ('card-2', None, 'b')])
+
+    assert submitter.batch_url is None
+    assert results == [{'Status': 'success'}] * 2
+    assert len(state.swipes) == 2
+
+
+def test_single_swipe_is_not_batched(session, standin):
+    state, base = standin(batch=False)
+    submitter = make_submitter(session, base, batch_url=base + '/cardreaderrequest/batch/')
+
+    assert submitter.post_many([('card-1', None, 'a')]) == [{'Status': 'success'}]
+    assert submitter.batch_url is not None
+
+
+def test_batch_is_sent_again_with_the_same_key(session):
+    sent = []
+
+    class Recorder:
+        def post(self, url, timeout=None, data=None, headers=None):
+            sent.append((headers['Idempotency-Key'], json.loads(gzip.decompress(data))))
+            raise requests.ConnectionError()
+
+    submitter = make_submitter(Recorder(), 'http://localhost:1', batch_url='http://localhost:1/batch/')
+    swipes = [('card-1', 1.0, 'a'), ('card-2', 2.0, 'b')]
+
+    assert submitter.post_many(swipes) == [None, None]
+    assert submitter.post_many(swipes) == [None, None]
+    assert sent[0] == sent[1]
@@ -0,0 +1,83 @@
+import json
+import os
+import pytest
+from configstore import ConfigStore, ConfigError, FIELDS, validate
+
+
+def test_missing_fields_get_defaults():
+    values = validate({'id': 'reader-1'})
+
+    assert values['volume'] == FIELDS['volume'][1]
+    assert values['network'] == []
+
+
+def test_numbers_are_converted():
+    values = validate({'id': 7, 'ping_frequency': 5, 'volume': 50.0, 'card_debounce': '1.5', 'uid_cache_size': '100'})
+
+    assert values['id'] == '7'
+    assert values['ping_frequency'] == 5.0 and isinstance(values['ping_frequency'], float)
+    assert values['volume'] == 50 and isinstance(values['volume'], int)
+    assert values['card_debounce'] == 1.5
+    assert values['uid_cache_size'] == 100
+
+
+@pytest.mark.parametrize('data', [
+    {},
+    {'id': None},
+    {'id': 'reader-1', 'volume': 'loud'},
+    {'id': 'reader-1', 'volume': 5.5},
+    {'id': 'reader-1', 'http2': 'yes'},
+    {'id': 'reader-1', 'network': {}},
+    {'id': 'reader-1', 'reader_crc': 'both'},
+])
+def test_invalid_configurations(data):
+    with pytest.raises(ConfigError):
+        validate(data)
+
+
+def write(path, data):
+    path.write_text(json.dumps(data))
+
+    # Make sure the change is seen even on coarse file system clocks
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+
+def test_reload_reports_changed_fields(tmp_path):
+    path = tmp_path / 'CONFIG.json'
+    write(path, {'id': 'reader-1', 'volume': 50})
+    config = ConfigStore(str(path))
+    calls = []
+    config.subscribe(['volume'], calls.append)
+    config.subscribe(['ping_frequency'], calls.append)
+
+    assert config.reload() == set()
+
+    write(path, {'id': 'reader-1', 'volume': 60})
+
+    assert config.reload() == {'volume'}
+    assert config.volume == 60 and config['volume'] == 60
+    assert calls == [{'volume'}]
+
+
+def test_same_contents_written_again_change_nothing(tmp_path):
+    path = tmp_path / 'CONFIG.json'
+    write(path, {'id': 'reader-1'})
+    config = ConfigStore(str(path))
+
+    write(path, {'id': 'reader-1'})
+
+    assert config.reload() == set()
+
+
+def test_invalid_file_keeps_previous_configuration(tmp_path):
+    path = tmp_path / 'CONFIG.json'
+    write(path, {'id': 'reader-1', 'volume': 60})
+    config = ConfigStore(str(path))
+
+    write(path, {'id': 'reader-1', 'volume': 'loud'})
+
+    with pytest.raises(ConfigError):
+        config.reload()
+
+    assert config.volume == 60
@@ -0,0 +1,81 @@
+from conftest import free_port
+from journal import Journal, Replayer
+from submitter import Submitter, STORED
+
+
+def make_submitter(session, base, **kwargs):
+    return Submitter(session, base + '/cardreaderrequest/', 'reader-1', **kwargs)
+
+
+def test_swipes_are_synced(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.db'))
+
+    # 2 is FULL
+    assert journal._db.execute('PRAGMA synchronous').fetchone() == (2,)
+    assert journal._db.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+    journal.close()
+
+
+def test_failed_swipes_in_order(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.db'))
+    ids = [journal.append(value, key) for value, key in (('card-1', 'a'), ('card-2', 'b'), ('card-3', 'c'))]
+
+    journal.fail(ids)
+    journal.complete(ids[1:2])
+
+    assert [(key, value) for record_id, key, value, swipe_time in journal.failed(10)] == [('a', 'card-1'), ('c', 'card-3')]
+
+    journal.close()
+
+
+def test_pending_swipes_are_replayed_after_restart(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = Journal(path)
+    journal.append('card-1')
+    journal.close()
+
+    journal = Journal(path)
+
+    assert [value for record_id, key, value, swipe_time in journal.failed(10)] == ['card-1']
+
+    journal.close()
+
+
+def test_unreachable_swipe_is_replayed(session, standin, tmp_path):
+    port = free_port()
+    base = 'http://localhost:{}'.format(port)
+    journal = Journal(str(tmp_path / 'journal.db'))
+    submitter = make_submitter(session, base, journal=journal, batch_url=base + '/cardreaderrequest/batch/')
+    results = []
+
+    submitter.submit('card-1', results.append)
+    submitter.process_next()
+
+    assert results == [STORED]
+    assert len(journal.failed(10)) == 1
+
+    state, base = standin(port)
+
+    try:
+        Replayer(journal, submitter).replay_next()
+
+        assert [swipe[1] for swipe in state.swipes] == ['card-1']
+        assert journal.failed(10) == []
+    finally:
+        journal.close()
+
+
+def test_replay_backs_off_while_unreachable(session, tmp_path):
+    base = 'http://localhost:{}'.format(free_port())
+    journal = Journal(str(tmp_path / 'journal.db'))
+    journal.fail([journal.append('card-1')])
+    replayer = Replayer(journal, make_submitter(session, base), min_backoff=60)
+
+    replayer.replay_next()
+    replayer.replay_next()
+
+    assert len(journal.failed(10)) == 1
+    assert replayer._backoff == 120
+
+    journal.close()
@@ -0,0 +1,73 @@
+import SimpleMFRC522
+from simulator import SimulatedBackend, MifareClassicCard
+
+
+TEXT_LENGTH = len(SimpleMFRC522.SimpleMFRC522.BLOCK_ADDRS) * 16
+
+
+def make_reader(**kwargs):
+    backend = SimulatedBackend()
+    return backend, SimpleMFRC522.SimpleMFRC522(backend=backend, **kwargs)
+
+
+def make_card(text, uid=(0x12, 0x34, 0x56, 0x78)):
+    card = MifareClassicCard(uid=uid)
+    card.write_text(text)
+    return card
+
+
+def tap(backend, card):
+    backend.remove()
+    backend.place(card)
+
+
+def test_no_card():
+    backend, reader = make_reader()
+
+    assert reader.read_no_block() == (None, None)
+
+
+def test_read():
+    backend, reader = make_reader()
+    card = make_card('student 42')
+    backend.place(card)
+
+    id, text = reader.read_no_block()
+
+    assert id == reader.uid_to_num(card.uid + [card.bcc])
+    assert text == 'student 42'.ljust(TEXT_LENGTH)
+
+
+def test_same_card_is_debounced():
+    backend, reader = make_reader(debounce=60)
+    card = make_card('student 42')
+
+    tap(backend, card)
+    assert reader.read_no_block()[0] is not None
+
+    tap(backend, card)
+    assert reader.read_no_block() == (None, None)
+
+
+def test_other_card_is_read_right_away():
+    backend, reader = make_reader(debounce=60)
+
+    tap(backend, make_card('student 42'))
+    reader.read_no_block()
+
+    tap(backend, make_card('student 43', uid=(0x9A, 0xBC, 0xDE, 0xF0)))
+    assert reader.read_no_block()[1] == 'student 43'.ljust(TEXT_LENGTH)
+
+
+def test_card_that_failed_to_read_is_read_again():
+    backend, reader = make_reader(debounce=60)
+    card = MifareClassicCard(key=(0x00,) * 6)
+    card.write_text('student 42')
+    backend.place(card)
+
+    assert reader.read_no_block() == (None, None)
+
+    # Still on the reader, and now readable
+    card.blocks[11] = MifareClassicCard().blocks[11]
+
+    assert reader.read_no_block()[1] == 'student 42'.ljust(TEXT_LENGTH)
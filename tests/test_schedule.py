@@ -0,0 +1,69 @@
+import pytest
+from repeater import Schedule
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fixed_delay_waits_interval_after_each_run():
+    clock = Clock()
+    schedule = Schedule(5, Schedule.FIXED_DELAY, clock=clock)
+
+    assert schedule.first() == 0
+
+    clock.now += 3
+    assert schedule.next() == 5
+
+
+def test_fixed_rate_does_not_drift():
+    clock = Clock()
+    schedule = Schedule(5, Schedule.FIXED_RATE, clock=clock)
+    schedule.first()
+
+    # Runs take 1.5 seconds, the next one is still due on the period
+    for i in range(10):
+        clock.now += 1.5
+        wait = schedule.next()
+        assert wait == pytest.approx(3.5)
+        clock.now += wait
+
+    assert clock.now == pytest.approx(150)
+
+
+def test_fixed_rate_skips_missed_runs():
+    clock = Clock()
+    schedule = Schedule(5, Schedule.FIXED_RATE, clock=clock)
+    schedule.first()
+
+    clock.now += 12
+    assert schedule.next() == pytest.approx(3)
+
+
+def test_jitter_stays_in_range():
+    schedule = Schedule(5, Schedule.FIXED_DELAY, jitter=2, clock=Clock())
+
+    assert 0 <= schedule.first() <= 2
+
+    for i in range(100):
+        assert 5 <= schedule.next() <= 7
+
+
+def test_failures_back_off_up_to_the_limit():
+    clock = Clock()
+    schedule = Schedule(2, Schedule.FIXED_RATE, max_backoff=10, clock=clock)
+    schedule.first()
+
+    waits = []
+
+    for i in range(5):
+        waits.append(schedule.next(False))
+        clock.now += waits[-1]
+
+    assert waits == [2, 4, 8, 10, 10]
+    assert schedule.next() == pytest.approx(2)
@@ -0,0 +1,49 @@
+from conftest import free_port
+from submitter import Submitter
+
+
+def make_submitter(session, base, **kwargs):
+    return Submitter(session, base + '/cardreaderrequest/', 'reader-1', **kwargs)
+
+
+def test_post(session, standin):
+    state, base = standin()
+    submitter = make_submitter(session, base)
+
+    assert submitter.post('card-1', key='a') == {'Status': 'success'}
+    assert submitter.post('fail-card', key='b') == {'Status': 'failure'}
+    assert [swipe[1] for swipe in state.swipes] == ['card-1', 'fail-card']
+
+
+def test_queued_swipe_is_posted(session, standin):
+    state, base = standin()
+    submitter = make_submitter(session, base)
+    results = []
+
+    assert submitter.submit('card-1', results.append)
+    submitter.process_next()
+
+    assert results == [{'Status': 'success'}]
+
+
+def test_full_queue_drops_swipe(session):
+    submitter = make_submitter(session, 'http://localhost:1', max_pending=1)
+
+    assert submitter.submit('card-1', print)
+    assert not submitter.submit('card-2', print)
+
+
+def test_unreachable_server_answers_none(session):
+    submitter = make_submitter(session, 'http://localhost:{}'.format(free_port()))
+    results = []
+
+    submitter.submit('card-1', results.append)
+    submitter.process_next()
+
+    assert results == [None]
+
+
+def test_process_next_returns_when_nothing_is_queued(session):
+    submitter = make_submitter(session, 'http://localhost:1')
+
+    submitter.process_next(timeout=0.01)
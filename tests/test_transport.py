@@ -0,0 +1,15 @@
+from submitter import Submitter
+
+
+def make_submitter(session, base, **kwargs):
+    return Submitter(session, base + '/cardreaderrequest/', 'reader-1', **kwargs)
+
+
+def test_post_again_is_recorded_once(session, standin):
+    state, base = standin()
+    submitter = make_submitter(session, base)
+
+    submitter.post('card-1', key='a')
+    submitter.post('card-1', key='a')
+
+    assert len(state.swipes) == 1
@@ -0,0 +1,102 @@
+import time
+import SimpleMFRC522
+from cache import TTLCache, PersistentTTLCache
+from simulator import SimulatedBackend, MifareClassicCard
+
+
+TEXT_LENGTH = len(SimpleMFRC522.SimpleMFRC522.BLOCK_ADDRS) * 16
+
+
+def make_reader(**kwargs):
+    backend = SimulatedBackend()
+    return backend, SimpleMFRC522.SimpleMFRC522(backend=backend, debounce=0, uid_cache=TTLCache(60, 10), **kwargs)
+
+
+def make_card(text):
+    card = MifareClassicCard()
+    card.write_text(text)
+    return card
+
+
+def tap(backend, card):
+    backend.remove()
+    backend.place(card)
+
+
+def test_expired_entry_is_forgotten():
+    now = [0]
+    cache = TTLCache(10, 10, clock=lambda: now[0])
+    cache.put('a', 'text')
+
+    now[0] = 9
+    assert cache.get('a') == 'text'
+
+    now[0] = 10
+    assert cache.get('a') is None
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = TTLCache(60, 2)
+    cache.put('a')
+    cache.put('b')
+    cache.get('a')
+    cache.put('c')
+
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+
+def test_cached_card_is_not_read_again():
+    backend, reader = make_reader()
+    card = make_card('student 42')
+
+    tap(backend, card)
+    reader.read_no_block()
+    first = backend.transfers
+
+    tap(backend, card)
+    before = backend.transfers
+    assert reader.read_no_block()[1] == 'student 42'.ljust(TEXT_LENGTH)
+    assert backend.transfers - before < first
+
+
+def test_write_updates_cache():
+    backend, reader = make_reader()
+    card = make_card('student 42')
+
+    tap(backend, card)
+    reader.read_no_block()
+
+    tap(backend, card)
+    reader.write_no_block('student 99')
+
+    tap(backend, card)
+    assert reader.read_no_block()[1] == 'student 99'.ljust(TEXT_LENGTH)
+
+
+def test_persistent_cache_saves_in_the_background(tmp_path):
+    path = str(tmp_path / 'uid_cache.json')
+    cache = PersistentTTLCache(path, 60, 10, save_delay=0.05)
+
+    cache.put('a', 'text')
+    cache.put('b', 'more text')
+
+    deadline = time.monotonic() + 5
+    while PersistentTTLCache(path, 60, 10).get('b') is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert PersistentTTLCache(path, 60, 10).get('a') == 'text'
+
+
+def test_persistent_cache_flush(tmp_path):
+    path = str(tmp_path / 'uid_cache.json')
+    cache = PersistentTTLCache(path, 60, 10, save_delay=60)
+
+    cache.put('a', 'text')
+    cache.flush()
+    cache.remove('a')
+    cache.put('b', 'more text')
+    cache.flush()
+
+    stored = PersistentTTLCache(path, 60, 10)
+    assert stored.get('a') is None
+    assert stored.get('b') == 'more text'
@@ -0,0 +1,77 @@
+import json
+import pytest
+import usbconfig
+
+
+NETWORKS = [{'ssid': '"campus"', 'psk': '"secret"'}]
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    """ A drive and a reader's files in tmp_path, with Wi-Fi changes recorded """
+
+    drive = tmp_path / 'drive'
+    images = tmp_path / 'images'
+    drive.mkdir()
+    images.mkdir()
+
+    config_path = tmp_path / 'CONFIG.json'
+    config_path.write_text(json.dumps({'id': '1', 'network': NETWORKS}))
+
+    networks_set = []
+
+    monkeypatch.setattr(usbconfig, 'CONFIG_PATH', str(config_path))
+    monkeypatch.setattr(usbconfig, 'IMAGES_PATH', str(images))
+    monkeypatch.setattr(usbconfig, 'get_flashdrive_path', lambda: str(drive))
+    monkeypatch.setattr(usbconfig, '_get_network_config', lambda: NETWORKS)
+    monkeypatch.setattr(usbconfig, '_set_network_config', networks_set.append)
+    monkeypatch.setattr(usbconfig, '_reconfigure_wifi', lambda: True)
+
+    return drive, images, config_path, networks_set
+
+
+def written(config_path):
+    return json.loads(config_path.read_text())
+
+
+def test_missing_network_leaves_wifi_alone(device):
+    drive, images, config_path, networks_set = device
+
+    assert usbconfig.perform_config({'volume': 40}, '1', {'id': '1', 'network': NETWORKS})
+    assert networks_set == []
+    assert written(config_path) == {'volume': 40, 'id': '1'}
+
+
+def test_changed_network_is_applied(device):
+    drive, images, config_path, networks_set = device
+    networks = [{'ssid': '"other"', 'psk': '"secret"'}]
+
+    assert usbconfig.perform_config({'network': networks}, '1', {'id': '1', 'network': NETWORKS})
+    assert networks_set == [networks]
+
+
+def test_same_network_is_not_rewritten(device):
+    drive, images, config_path, networks_set = device
+
+    usbconfig.perform_config({'network': NETWORKS, 'volume': 40}, '1', {'id': '1', 'network': NETWORKS})
+
+    assert networks_set == []
+
+
+def test_image_is_copied(device):
+    drive, images, config_path, networks_set = device
+    (drive / 'logo.png').write_bytes(b'new image')
+
+    usbconfig.perform_config({'custom_idle_image': 'logo.png'}, '1', {'id': '1'})
+
+    assert (images / 'logo.png').read_bytes() == b'new image'
+
+
+def test_image_missing_from_drive_keeps_applying(device):
+    drive, images, config_path, networks_set = device
+    (images / 'logo.png').write_bytes(b'old image')
+
+    usbconfig.perform_config({'custom_idle_image': 'logo.png', 'volume': 40}, '1', {'id': '1'})
+
+    assert (images / 'logo.png').read_bytes() == b'old image'
+    assert written(config_path)['volume'] == 40
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# (connect, read) timeouts in seconds for each kind of request
+SWIPE_TIMEOUT = (3.05, 5)
+BATCH_TIMEOUT = (3.05, 15)
+CHECKIN_TIMEOUT = (3.05, 10)
+
+# Gateway errors worth another try, the request didn't reach the server
+RETRY_STATUSES = (502, 503, 504)
+
+
+def _retry(retries, methods):
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.3,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+
+    try:
+        return Retry(allowed_methods=methods, **kwargs)
+    except TypeError:
+        # urllib3 before 1.26
+        return Retry(method_whitelist=methods, **kwargs)
+
+
+def create_session(pool_size=2, retries=2, retry_posts=False, http2=False):
+    """
+    Create a session for talking to the server. Connections are kept
+    alive and reused, so most requests skip the TCP and TLS handshakes.
+
+    Failed connections are always retried, since nothing was sent. A
+    request whose response was lost or that got a gateway error is only
+    retried for GET and HEAD, and also for POST with retry_posts, which is
+    only safe when every POST carries an Idempotency-Key the server
+    deduplicates on.
+
+    Parameters:
+        pool_size (int): most connections kept open to the server, should
+        be at least the number of threads using the session
+        retries (int): most retries per request
+        retry_posts (bool): whether POSTs are retried like GETs
+        http2 (bool): use HTTP/2 if httpx is installed
+
+    Returns:
+        requests.Session or Http2Session: the session
+    """
+
+    if http2:
+        try:
+            return Http2Session(pool_size, retries)
+        except ImportError as e:
+            print('HTTP/2 not available, using HTTP/1.1:', e)
+
+    methods = frozenset(['GET', 'HEAD', 'POST'] if retry_posts else ['GET', 'HEAD'])
+
+    # pool_block makes extra threads wait for a connection instead of
+    # opening ones that are thrown away afterwards
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=_retry(retries, methods),
+        pool_block=True
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+class Http2Session:
+    """
+    Session with the parts of the requests.Session interface the reader
+    uses, backed by an httpx client speaking HTTP/2. Errors are raised as
+    requests exceptions so callers handle both sessions the same way.
+    httpx only retries failed connections.
+    """
+
+    def __init__(self, pool_size=2, retries=2):
+        import httpx
+
+        self._httpx = httpx
+        # A client ignores its own limits when given a transport
+        self._client = httpx.Client(
+            transport=httpx.HTTPTransport(
+                http2=True,
+                retries=retries,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+        )
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, data=None, **kwargs):
+        if isinstance(data, (bytes, str)):
+            kwargs['content'] = data
+        else:
+            kwargs['data'] = data
+
+        return self.request('POST', url, **kwargs)
+
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = self._httpx.Timeout(read, connect=connect)
+
+        try:
+            return self._client.request(method, url, timeout=timeout, **kwargs)
+        except self._httpx.TimeoutException as e:
+            raise requests.Timeout(e)
+        except self._httpx.HTTPError as e:
+            raise requests.ConnectionError(e)
+
+
+    def close(self):
+        self._client.close()
@@ -3,6 +3,16 @@
 import os
 import json
 import re
+import hashlib
+import subprocess
+from configstore import CONFIG_PATH
+
+
+IMAGES_PATH = '/home/pi/qwickly/images'
+
+# Wireless interface wpa_supplicant manages
+WIFI_INTERFACE = 'wlan0'
+
 
 def get_flashdrive_path():
     """
@@ -48,24 +58,29 @@ def get_current_config():
     Return contents of current configuration file, omit "id"
     """
     
-    config_file = open('/home/pi/qwickly/CONFIG.json', 'r')
+    config_file = open(CONFIG_PATH, 'r')
     config_data = json.load(config_file)
     config_file.close()
     
     return config_data
 
 
-def config_needed():
+def config_needed(new_conf=None, old_conf=None):
     """
-    Return True if provided configuration is not already implemented
+    Return True if provided configuration is not already implemented.
+    The provided and current configurations are read unless given.
     """
     
-    new_conf = get_provided_config()
+    if new_conf is None:
+        new_conf = get_provided_config()
     
     if not new_conf:
         return False
     
-    old_conf = get_current_config()
+    if old_conf is None:
+        old_conf = get_current_config()
+    
+    old_conf = dict(old_conf)
     del old_conf['id']
     
     return new_conf != old_conf
@@ -107,6 +122,101 @@ def _get_network_config():
     return current_config
 
 
+def _write_atomic(path, data):
+    """
+    Replace the contents of a file in one step, so it's never left half
+    written if power is lost. The new file keeps the old one's permissions.
+    """
+    
+    directory = os.path.dirname(path)
+    temp_path = path + '.tmp'
+    
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    
+    with open(temp_path, mode) as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    
+    if os.path.exists(path):
+        stat = os.stat(path)
+        os.chmod(temp_path, stat.st_mode)
+        
+        try:
+            os.chown(temp_path, stat.st_uid, stat.st_gid)
+        except PermissionError:
+            pass
+    
+    os.replace(temp_path, path)
+    
+    # Make the rename itself durable
+    dir_fd = os.open(directory or '.', os.O_RDONLY)
+    
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _file_hash(path):
+    """
+    Return the sha256 of a file's contents, or None if it can't be read
+    """
+    
+    digest = hashlib.sha256()
+    
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    
+    return digest.hexdigest()
+
+
+def _copy_image(source_dir, filename):
+    """
+    Copy an image into the images directory unless an identical copy is
+    already there. An image missing from the drive is left as it is.
+    Return True if it was copied
+    """
+    
+    source = '{}/{}'.format(source_dir, filename)
+    target = '{}/{}'.format(IMAGES_PATH, filename)
+    
+    source_hash = _file_hash(source)
+    
+    if source_hash is None:
+        print('{} is not on the configuration drive, not copied'.format(filename))
+        return False
+    
+    if source_hash == _file_hash(target):
+        return False
+    
+    with open(source, 'rb') as source_file:
+        _write_atomic(target, source_file.read())
+    
+    return True
+
+
+def _reconfigure_wifi():
+    """
+    Make wpa_supplicant load its configuration again. Return True if it did
+    """
+    
+    try:
+        result = subprocess.run(
+            ['wpa_cli', '-i', WIFI_INTERFACE, 'reconfigure'],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(e)
+        return False
+    
+    return result.returncode == 0 and b'OK' in result.stdout
+
+
 def _set_network_config(net_config):
     """
     Apply provided config to Wi-Fi settings
@@ -133,41 +243,58 @@ def _set_network_config(net_config):
         
         config_text += '}'
         
-    config_file = open('/etc/wpa_supplicant/wpa_supplicant.conf', 'w')
-    config_file.write(config_text)
-    config_file.close()
+    _write_atomic('/etc/wpa_supplicant/wpa_supplicant.conf', config_text)
 
 
-def perform_config():
+def set_volume(volume):
     """
-    Copy CARDSWIPERCONFIG and apply new settings
+    Set the output volume in percent
     """
     
-    id = get_current_config()['id']
+    os.system("amixer sset 'Master' {}%".format(volume))
+
+
+def perform_config(config_data=None, id=None, old_conf=None):
+    """
+    Copy CARDSWIPERCONFIG and apply the settings that changed. The
+    provided configuration, current id and current configuration are read
+    unless given. Files are replaced atomically, images are only copied if
+    their contents differ and Wi-Fi is reconfigured without a reboot. The
+    volume is left to whoever follows the configuration.
     
-    config_data = get_provided_config()
-    config_data['id'] = id
+    Return False if the new settings couldn't all be applied and a reboot
+    is needed
+    """
     
-    config_file = open('/home/pi/qwickly/CONFIG.json', 'w')
-    json.dump(config_data, config_file)
-    config_file.close()
+    if old_conf is None:
+        old_conf = get_current_config()
     
-    if _get_network_config() != config_data['network']:
-        _set_network_config(config_data['network'])
+    if id is None:
+        id = old_conf['id']
     
-    os.system("amixer sset 'Master' {}%".format(config_data['volume']))
+    if config_data is None:
+        config_data = get_provided_config()
+    
+    config_data = dict(config_data)
+    config_data['id'] = id
     
-    copy_command = 'cp {drive_path}/{filename} /home/pi/qwickly/images/{filename}'
+    # Images go first so they are in place once the configuration names them
+    drive_path = get_flashdrive_path()
     
-    if config_data['custom_idle_image']:
-        os.system(copy_command.format(
-            drive_path=get_flashdrive_path(), 
-            filename=config_data['custom_idle_image']
-        ))
+    for image in ('custom_idle_image', 'custom_active_image'):
+        if config_data.get(image):
+            _copy_image(drive_path, config_data[image])
+    
+    applied = True
+    
+    # Wi-Fi is left alone unless the configuration lists networks
+    network = config_data.get('network')
+
+    if network is not None and _get_network_config() != network:
+        _set_network_config(network)
+        applied = _reconfigure_wifi()
     
-    if config_data['custom_active_image']:
-        os.system(copy_command.format(
-            drive_path=get_flashdrive_path(), 
-            filename=config_data['custom_active_image']
-        ))
+    if config_data != old_conf:
+        _write_atomic(CONFIG_PATH, json.dumps(config_data))
     
+    return applied